@@ -0,0 +1,92 @@
+"""
+Compares per-file latency and peak RSS of the header-only Exif reader
+against opening files with Pillow.
+
+Usage:
+  python benchmarks/exif_reader.py [<media_dir>]
+
+If no directory is given, a small set of synthetic JPEG/HEIC files
+is generated in a temp dir. Each reader runs in its own process so
+peak RSS is measured independently.
+"""
+import multiprocessing
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+from pillow_heif import register_heif_opener
+register_heif_opener()
+import piexif
+
+from cloud_services_backup_cli.tools.media import IMAGE_EXTS, load_exif_from_header
+
+
+def read_with_header(file_path: Path) -> None:
+    load_exif_from_header(file_path)
+
+def read_with_pillow(file_path: Path) -> None:
+    with Image.open(file_path) as img:
+        exif_bytes = img.info.get("exif", b"")
+        if exif_bytes:
+            piexif.load(exif_bytes)
+
+READERS = {
+    "header": read_with_header,
+    "pillow": read_with_pillow,
+}
+
+
+def run_reader(name: str, files: list[Path], results: multiprocessing.Queue) -> None:
+    reader = READERS[name]
+    started = time.perf_counter()
+    for file in files:
+        reader(file)
+    elapsed = time.perf_counter() - started
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((name, elapsed, peak_rss_kb))
+
+def generate_files(target_dir: Path, count: int = 200) -> list[Path]:
+    exif = piexif.dump({
+        "0th": { piexif.ImageIFD.DateTime: b"2020:01:02 03:04:05" },
+        "Exif": { piexif.ExifIFD.DateTimeOriginal: b"2020:01:02 03:04:05" },
+    })
+    img = Image.effect_noise((2048, 1536), 64).convert("RGB")
+    templates = {}
+    for ext in (".jpg", ".heic"):
+        templates[ext] = target_dir.joinpath(f"template{ext}")
+        img.save(templates[ext], exif=exif, quality=90)
+
+    files = []
+    for i in range(count):
+        ext = ".heic" if i % 4 == 0 else ".jpg"
+        file = target_dir.joinpath(f"IMG_{i:04d}{ext}")
+        shutil.copyfile(templates[ext], file)
+        files.append(file)
+    return files
+
+def main(argv: list[str]) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if len(argv) > 1:
+            files = sorted(f for f in Path(argv[1]).rglob("*") if f.suffix.lower() in IMAGE_EXTS)
+        else:
+            print("Generating synthetic images...")
+            files = generate_files(Path(tmp_dir))
+
+        print(f"Reading Exif from {len(files)} file(s)")
+        print(f"{'reader':<8} {'total (s)':>10} {'per file (ms)':>14} {'peak RSS (MB)':>14}")
+        results = multiprocessing.Queue()
+        for name in READERS:
+            process = multiprocessing.Process(target=run_reader, args=(name, files, results))
+            process.start()
+            process.join()
+            (_, elapsed, peak_rss_kb) = results.get()
+            per_file_ms = elapsed * 1000 / max(len(files), 1)
+            print(f"{name:<8} {elapsed:>10.3f} {per_file_ms:>14.3f} {peak_rss_kb / 1024:>14.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,72 @@
+"""
+Import-time regression check for the CLI entry point.
+
+Usage:
+  python benchmarks/import_time.py [<service>]
+
+Runs 'python -X importtime' on the CLI module, optionally resolving
+a service (e.g. 'github'), prints the slowest imports and exits
+non-zero if heavy dependencies not needed by that service were loaded.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+# Heavy modules and the services that are allowed to load them
+HEAVY_MODULES = {
+    "PIL": [],
+    "pillow_heif": [],
+    "piexif": [],
+    "hachoir": [],
+    "requests": ["github", "bitbucket"],
+}
+
+
+def import_times(service_slug: str | None) -> list[tuple[int, str]]:
+    code = "import cloud_services_backup_cli.__main__ as m"
+    if service_slug:
+        code += f"; m.resolve_service({service_slug!r})"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            env={
+                **os.environ,
+                "CLOUD_BACKUP_CONFD": os.environ.get("CLOUD_BACKUP_CONFD", tmp_dir),
+                "CLOUD_BACKUP_DATAD": os.environ.get("CLOUD_BACKUP_DATAD", tmp_dir),
+            },
+            check=True, capture_output=True, text=True)
+
+    # Returns (cumulative_us, module, is_top_level) for each import
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line: continue
+        (_, cumulative_us, module) = line.split("|")
+        is_top_level = not module[1:].startswith(" ")
+        times.append((int(cumulative_us), module.strip(), is_top_level))
+    return times
+
+def main(argv: list[str]) -> None:
+    service_slug = argv[1] if len(argv) > 1 else None
+    times = import_times(service_slug)
+
+    # Everything imported at the top level after interpreter startup
+    total_us = sum(us for us, module, is_top_level in times
+        if is_top_level and module not in ("site", "encodings") and not module.startswith("_"))
+    print(f"Importing CLI{f' and {service_slug}' if service_slug else ''}: {total_us / 1000:.1f} ms")
+    print("Slowest imports:")
+    for us, module, _ in sorted(times, reverse=True)[:10]:
+        print(f"  {us / 1000:>8.1f} ms  {module}")
+
+    loaded = {module for _, module, _ in times}
+    unexpected = [
+        module for module, allowed in HEAVY_MODULES.items()
+            if module in loaded and service_slug not in allowed
+    ]
+    if unexpected:
+        print(f"Unexpected heavy imports: {', '.join(unexpected)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,80 @@
+"""
+Compares reading a .tgz Takeout archive with tarfile's default gzip
+stream, with the large-buffer built-in reader, and by piping it through
+an external tool (igzip, pigz, or plain gzip as a baseline for the
+pipe itself).
+
+Usage:
+  python benchmarks/tgz_extract.py [<size_mb>] [<archive.tgz>]
+
+If no archive is given, a synthetic one of roughly <size_mb> MB
+(default 2048) is generated in a temp dir, made of moderately
+compressible files similar to photos and documents.
+"""
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+
+from cloud_services_backup_cli.tools.archive import COPY_BUFFER_SIZE, open_tgz_stream
+
+
+def generate_archive(archive: Path, size_mb: int) -> None:
+    file_size = 8 * 1024 * 1024
+    # Half random, half repeated bytes, so the data compresses about 2:1
+    chunk = os.urandom(file_size // 2) + bytes(file_size // 2)
+    with tarfile.open(archive, "w:gz", compresslevel=6) as tar:
+        for i in range(max(1, size_mb * 1024 * 1024 // file_size)):
+            info = tarfile.TarInfo(f"Takeout/Drive/file_{i:05d}.bin")
+            info.size = file_size
+            info.mtime = int(time.time())
+            with tempfile.SpooledTemporaryFile(max_size=file_size * 2) as f:
+                f.write(chunk)
+                f.seek(0)
+                tar.addfile(info, f)
+
+def read_archive(archive: Path, gzip_tool: str | None) -> int:
+    if gzip_tool is None:
+        # Baseline: tarfile's own gzip stream with its default buffer size
+        with tarfile.open(archive, "r|gz") as tar:
+            return read_members(tar)
+    with open_tgz_stream(archive, gzip_tool) as tar:
+        return read_members(tar)
+
+def read_members(tar: tarfile.TarFile) -> int:
+    total = 0
+    for info in tar:
+        if not info.isfile(): continue
+        f = tar.extractfile(info)
+        while True:
+            data = f.read(COPY_BUFFER_SIZE)
+            if not data: break
+            total += len(data)
+    return total
+
+def main(argv: list[str]) -> None:
+    size_mb = int(argv[1]) if len(argv) > 1 else 2048
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if len(argv) > 2:
+            archive = Path(argv[2])
+        else:
+            archive = Path(tmp_dir, "takeout-bench-001.tgz")
+            print(f"Generating ~{size_mb} MB synthetic archive...")
+            generate_archive(archive, size_mb)
+
+        print(f"Archive: {archive.stat().st_size / (1024 * 1024):.0f} MB compressed")
+        print(f"{'decompressor':<14} {'seconds':>8} {'MB/s':>8}")
+        tools = [("tarfile r|gz", None), ("python", "python")] + [
+            (tool, shutil.which(tool)) for tool in ("gzip", "pigz", "igzip") if shutil.which(tool)]
+        for name, path in tools:
+            started = time.perf_counter()
+            total = read_archive(archive, path)
+            elapsed = time.perf_counter() - started
+            print(f"{name:<14} {elapsed:>8.2f} {total / (1024 * 1024) / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
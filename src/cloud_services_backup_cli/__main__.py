@@ -22,6 +22,9 @@ def run(argv: list[str]) -> None:
     if command in ("", "help"):
         usage()
         sys.exit(0)
+    if command == "run-all":
+        run_all(argv[2] if len(argv) > 2 else None)
+        sys.exit(0)
     
     service_slug = command
     try:
@@ -48,6 +51,27 @@ def run(argv: list[str]) -> None:
         
     sys.exit(0)
 
+def run_all(jobs_file: str | None) -> None:
+    jobs = read_jobs(jobs_file or default_jobs_file())
+    if not jobs:
+        print("No jobs to run")
+        return
+    print(f"Running {len(jobs)} job(s) from {jobs_file or default_jobs_file()}")
+    if any(resolve_service(job.service_slug).uses_rclone for job in jobs):
+        # Started up front (if CLOUD_BACKUP_RCLONE_RCD is on), so that jobs
+        # forked from here all share the one rclone daemon
+        from .tools.rclone import rclone_daemon
+        rclone_daemon()
+    try:
+        results = run_jobs(jobs)
+    except KeyboardInterrupt:
+        error("Keyboard interrupt detected, exiting...")
+    print_job_results(results)
+
+    failed = [r for r in results if r.exit_code != 0]
+    if failed:
+        error(f"{len(failed)} of {len(results)} job(s) failed")
+
 def setup_logging() -> None:
     stdout = logging.StreamHandler(sys.stdout)
     stdout.addFilter(lambda r: r.levelno <= logging.INFO)
@@ -1,2 +1,6 @@
 from .util import *
+from .metrics import *
+from .timing import *
 from .service import *
+from .http import *
+from .runner import *
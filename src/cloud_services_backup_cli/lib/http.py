@@ -0,0 +1,210 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import re
+import threading
+import time
+from typing import Any, Callable
+from urllib.parse import parse_qs, urlparse
+
+__all__ = [
+    "HTTP_MAX_RETRIES", "HTTP_MAX_BACKOFF_SECS", "HTTP_CACHED_HEADERS", "HTTP_PAGE_WORKERS",
+    "HttpResult", "HttpClient", "http_link_urls", "http_query_param",
+]
+
+
+HTTP_MAX_RETRIES = 5
+HTTP_MAX_BACKOFF_SECS = 15 * 60
+HTTP_CACHED_HEADERS = ["Link"]
+HTTP_PAGE_WORKERS = 4
+
+
+@dataclass
+class HttpResult:
+    data: Any
+    headers: dict[str, str]
+    cached: bool = False
+
+
+class HttpClient():
+    # Shared HTTP client for JSON APIs. Uses a single requests.Session so
+    # connections are kept alive across calls, retries with backoff on
+    # transient errors and rate limiting (honoring Retry-After and the
+    # X-RateLimit-* headers), and keeps an on-disk ETag/Last-Modified cache
+    # so unchanged resources come back as a 304 from the server.
+    def __init__(self, cache_dir: Path | None = None, auth: tuple[str, str] | None = None,
+                 headers: dict[str, str] | None = None, max_retries: int = HTTP_MAX_RETRIES):
+        # requests is only needed by a few services, so it's imported here
+        # rather than at module load
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.headers.update(headers or {})
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def get_json(self, url: str, params: dict | None = None) -> HttpResult:
+        cache_file = self.__cache_file(url, params)
+        cache_entry = self.__read_cache(cache_file)
+
+        headers = {}
+        if cache_entry and cache_entry.get("etag"):
+            headers["If-None-Match"] = cache_entry["etag"]
+        if cache_entry and cache_entry.get("last_modified"):
+            headers["If-Modified-Since"] = cache_entry["last_modified"]
+
+        response = self.__get_with_retry(url, params, headers)
+        if response.status_code == 304 and cache_entry:
+            logging.debug(f"Not modified, using cached response for {response.url}")
+            return HttpResult(cache_entry["data"], cache_entry["headers"], cached=True)
+
+        response.raise_for_status()
+        data = response.json()
+        result_headers = {h: response.headers[h] for h in HTTP_CACHED_HEADERS if h in response.headers}
+        if cache_file and (response.headers.get("ETag") or response.headers.get("Last-Modified")):
+            self.__write_cache(cache_file, {
+                "url": response.url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "headers": result_headers,
+                "data": data,
+            })
+        return HttpResult(data, result_headers)
+
+    def get_json_pages(
+        self, url: str, params: dict, page_count: Callable[[HttpResult], int | None],
+        has_next: Callable[[HttpResult], bool], page_param: str = "page"
+    ) -> list[HttpResult]:
+        # Fetches page 1, then uses page_count() to work out the total number
+        # of pages from it, and fetches the remaining pages concurrently.
+        # If the total can't be determined, falls back to fetching pages one
+        # at a time while has_next() is true. Results are in page order.
+        first = self.get_json(url, { **params, page_param: 1 })
+        last_page = page_count(first)
+
+        if last_page is None:
+            results = [first]
+            while has_next(results[-1]):
+                results.append(self.get_json(url, { **params, page_param: len(results) + 1 }))
+            return results
+
+        if last_page <= 1:
+            return [first]
+        with ThreadPoolExecutor(max_workers=min(HTTP_PAGE_WORKERS, last_page - 1)) as executor:
+            rest = executor.map(
+                lambda page: self.get_json(url, { **params, page_param: page }),
+                range(2, last_page + 1))
+            return [first, *rest]
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __get_with_retry(self, url: str, params: dict | None, headers: dict[str, str]):
+        import requests
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=60)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.__backoff_delay(attempt)
+                logging.warning(f"Request to {url} failed ({e}), retrying in {delay:.0f}s...")
+            else:
+                delay = self.__retry_delay(response, attempt)
+                if delay is None:
+                    return response
+                logging.warning(f"Request to {response.url} returned {response.status_code}, retrying in {delay:.0f}s...")
+            time.sleep(delay)
+            attempt += 1
+
+    def __retry_delay(self, response, attempt: int) -> float | None:
+        # Returns how long to wait before retrying, or None if
+        # the response should be returned to the caller as-is
+        rate_limited = (
+            response.status_code == 429
+                or (response.status_code == 403 and response.headers.get("X-RateLimit-Remaining") == "0"))
+        if not rate_limited and response.status_code < 500:
+            return None
+        if attempt >= self.max_retries:
+            return None
+
+        delay = self.__retry_after(response)
+        if delay is None and rate_limited:
+            delay = self.__rate_limit_reset(response)
+        if delay is None:
+            delay = self.__backoff_delay(attempt)
+        if delay > HTTP_MAX_BACKOFF_SECS:
+            return None
+        return delay
+
+    def __retry_after(self, response) -> float | None:
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        if value.isdigit():
+            return float(value)
+        import email.utils
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    def __rate_limit_reset(self, response) -> float | None:
+        value = response.headers.get("X-RateLimit-Reset")
+        if not value or not value.isdigit():
+            return None
+        return max(1.0, int(value) - time.time() + 1)
+
+    def __backoff_delay(self, attempt: int) -> float:
+        return float(min(2 ** attempt, 60))
+
+    def __cache_file(self, url: str, params: dict | None) -> Path | None:
+        if not self.cache_dir:
+            return None
+        key = json.dumps([url, sorted((params or {}).items())], default=str)
+        return self.cache_dir.joinpath(hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    def __read_cache(self, cache_file: Path | None) -> dict | None:
+        if not cache_file or not cache_file.exists():
+            return None
+        try:
+            with open(cache_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def __write_cache(self, cache_file: Path, entry: dict) -> None:
+        tmp_file = cache_file.with_name(f"{cache_file.name}.{threading.get_ident()}.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_file, cache_file)
+
+
+def http_link_urls(headers: dict[str, str]) -> dict[str, str]:
+    # Parses an RFC 8288 Link header into { rel: url }, e.g.
+    #   <https://api.github.com/...&page=5>; rel="last"
+    links = {}
+    for match in re.finditer(r'<([^>]*)>\s*;\s*rel="?([^";]+)"?', headers.get("Link", "")):
+        for rel in match.group(2).split():
+            links[rel] = match.group(1)
+    return links
+
+def http_query_param(url: str, name: str) -> str | None:
+    values = parse_qs(urlparse(url).query).get(name)
+    return values[0] if values else None
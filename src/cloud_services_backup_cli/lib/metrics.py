@@ -0,0 +1,100 @@
+import logging
+import os
+from pathlib import Path
+import re
+import time
+
+from .util import *
+
+
+METRICS_PREFIX = "cloud_backup"
+
+# Counters recorded during a run (see report_count), written as gauges
+# named <METRICS_PREFIX>_<counter>. Only counters the run reported are
+# written, so a service that doesn't count something (or a run that failed
+# before counting it) leaves the metric absent rather than reporting 0.
+METRICS_COUNTERS = {
+    "bytes_transferred": "Bytes of files added to or updated in the backup by the last run.",
+    "files_added": "Files added to the backup by the last run.",
+    "files_updated": "Files updated in the backup by the last run.",
+    "files_transferred": "Files copied into the backup by rclone in the last run, new or updated.",
+    "files_deleted": "Files deleted from the backup by the last run.",
+    "repos_mirrored": "Git repos mirrored by the last run, whether or not they changed.",
+    "photos_linked": "Photos (and their metadata files) linked into the library by the last run.",
+}
+
+
+def metrics_dir() -> Path:
+    # Point CLOUD_BACKUP_METRICS_DIR at node_exporter's textfile
+    # collector directory to have these picked up by Prometheus
+    return Path(os.environ.get("CLOUD_BACKUP_METRICS_DIR") or backup_datad("metrics"))
+
+def metrics_file(service_slug: str, username: str) -> Path:
+    return metrics_dir().joinpath(f"{METRICS_PREFIX}_{slugify(service_slug)}_{slugify(username)}.prom")
+
+def write_run_metrics(report) -> None:
+    # Writes a Prometheus textfile for a finished RunReport, replacing the
+    # file from the service/user's previous run. The last success time is
+    # carried over from that file when this run didn't succeed.
+    prom_file = metrics_file(report.service_slug, report.username)
+    prom_file.parent.mkdir(parents=True, exist_ok=True)
+
+    now = time.time()
+    last_success = now if report.status == "succeeded" else __read_last_success(prom_file)
+    labels = { "service": report.service_slug, "user": report.username }
+
+    lines = []
+    __gauge(lines, "last_success_timestamp_seconds",
+        "Time the last successful run finished, in seconds since the epoch.",
+        [(labels, last_success)] if last_success is not None else [])
+    __gauge(lines, "last_run_timestamp_seconds",
+        "Time the last run finished, in seconds since the epoch.", [(labels, now)])
+    __gauge(lines, "last_run_success",
+        "Whether the last run succeeded (1) or not (0).", [(labels, int(report.status == "succeeded"))])
+    __gauge(lines, "run_duration_seconds",
+        "Wall time of the last run.", [(labels, report.root.wall_seconds)])
+    __gauge(lines, "phase_duration_seconds",
+        "Wall time of each phase of the last run, by path of nested phases.",
+        [({ **labels, "phase": phase }, s.wall_seconds) for phase, s in __phases(report.root, "")])
+    for name, help in METRICS_COUNTERS.items():
+        if name in report.counters:
+            __gauge(lines, name, help, [(labels, report.counters[name])])
+
+    # node_exporter only reads *.prom files, so it never sees the tmp file
+    tmp_file = prom_file.with_name(prom_file.name + ".tmp")
+    with open(tmp_file, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_file, prom_file)
+    logging.debug(f"Saved run metrics to {prom_file}")
+
+
+def __phases(s, parent_path: str):
+    for child in s.children:
+        path = f"{parent_path}/{child.name}" if parent_path else child.name
+        yield (path, child)
+        yield from __phases(child, path)
+
+def __gauge(lines: list[str], name: str, help: str, samples: list[tuple[dict[str, str], float]]) -> None:
+    metric = f"{METRICS_PREFIX}_{name}"
+    lines.append(f"# HELP {metric} {help}")
+    lines.append(f"# TYPE {metric} gauge")
+    for labels, value in samples:
+        label_str = ",".join(f'{k}="{__escape_label(v)}"' for k, v in labels.items())
+        lines.append(f"{metric}{{{label_str}}} {__format_value(value)}")
+
+def __escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def __format_value(value: float) -> str:
+    return str(value) if isinstance(value, int) else f"{value:.3f}"
+
+def __read_last_success(prom_file: Path) -> float | None:
+    if not prom_file.exists():
+        return None
+    pattern = re.compile(rf"^{METRICS_PREFIX}_last_success_timestamp_seconds{{.*}} (\S+)$")
+    with open(prom_file, "r") as f:
+        for line in f:
+            match = pattern.match(line.strip())
+            if match:
+                return float(match.group(1))
+    return None
@@ -0,0 +1,170 @@
+from dataclasses import dataclass
+from datetime import timedelta
+import logging
+import os
+from pathlib import Path
+import shlex
+import sys
+import tempfile
+import time
+
+from .util import *
+from .service import *
+
+
+RUN_JOBS = env_int("CLOUD_BACKUP_RUN_JOBS", 4)
+RUN_CLASS_JOBS = {
+    "network": env_int("CLOUD_BACKUP_RUN_NETWORK_JOBS", 4),
+    "disk": env_int("CLOUD_BACKUP_RUN_DISK_JOBS", 1),
+}
+RUN_SUBCOMMANDS = ["copy", "sync"]
+
+
+@dataclass
+class Job:
+    service_slug: str
+    subcommand: str
+    username: str
+    args: list[str]
+    resource_class: str
+    line: int = 0
+
+    def name(self) -> str:
+        return shlex.join([self.service_slug, self.subcommand, self.username, *self.args])
+
+
+@dataclass
+class JobResult:
+    job: Job
+    exit_code: int
+    seconds: float
+
+    def status(self) -> str:
+        return "ok" if self.exit_code == 0 else f"failed ({self.exit_code})"
+
+
+def default_jobs_file() -> Path:
+    return backup_confd("jobs.txt")
+
+def read_jobs(jobs_file: str | Path) -> list[Job]:
+    # One job per line, in the same form as the CLI's own arguments:
+    #   <service> <copy|sync> <username> [<args>...]
+    # Blank lines and '#' comments are ignored, and args are split
+    # shell-style, so quoted args (e.g. album names) work as they do
+    # on the command line
+    jobs_file = Path(jobs_file)
+    if not jobs_file.exists():
+        error(f"Jobs file not found at {jobs_file}")
+
+    jobs = []
+    with open(jobs_file, "r") as f:
+        for line_no, line in enumerate(f, start=1):
+            try:
+                tokens = shlex.split(line, comments=True)
+            except ValueError as e:
+                error(f"{jobs_file}:{line_no}: {e}")
+            if not tokens: continue
+            if len(tokens) < 3:
+                error(f"{jobs_file}:{line_no}: expected '<service> <subcommand> <username> [<args>...]'")
+
+            (service_slug, subcommand, username, *args) = tokens
+            try:
+                service_type = resolve_service(service_slug)
+            except KeyError:
+                error(f"{jobs_file}:{line_no}: invalid service '{service_slug}'")
+            if subcommand not in RUN_SUBCOMMANDS:
+                error(f"{jobs_file}:{line_no}: invalid subcommand '{subcommand}', expected one of {', '.join(RUN_SUBCOMMANDS)}")
+            jobs.append(Job(service_slug, subcommand, username, args, service_type.resource_class, line_no))
+    return jobs
+
+def run_jobs(jobs: list[Job]) -> list[JobResult]:
+    # Runs jobs concurrently, up to CLOUD_BACKUP_RUN_JOBS at a time overall and
+    # CLOUD_BACKUP_RUN_<CLASS>_JOBS at a time per resource class, so network-bound
+    # jobs (rclone, git, APIs) overlap while disk-bound jobs (Takeout extraction)
+    # don't compete with each other for the same disks. Disk-bound jobs for the
+    # same user never overlap either, since the Takeout services share that
+    # user's archives and extract folders. Jobs start in file order, except
+    # that a job waiting on its class doesn't hold up jobs of other classes.
+    #
+    # Each job runs in a forked child process with its output captured to a
+    # log file, which is printed in one piece when the job finishes so output
+    # from concurrent jobs isn't interleaved. A job that fails (or crashes)
+    # is reported in its result and doesn't stop the others.
+    import multiprocessing
+    from multiprocessing.connection import wait
+
+    context = multiprocessing.get_context("fork")
+    max_jobs = max(1, RUN_JOBS)
+    pending = list(jobs)
+    running = {}
+    results = []
+
+    while pending or running:
+        for job in list(pending):
+            if len(running) >= max_jobs: break
+            if not __can_start(job, [r[0] for r in running.values()]): continue
+            pending.remove(job)
+            log_file = tempfile.NamedTemporaryFile(
+                dir=backup_tmpd(), prefix="run-all.", suffix=".log", delete=False)
+            print(f"Starting '{job.name()}'...")
+            sys.stdout.flush()
+            sys.stderr.flush()
+            process = context.Process(target=__run_job_in_child, args=(job, log_file.fileno()))
+            process.start()
+            log_file.close()
+            running[process.sentinel] = (job, process, Path(log_file.name), time.monotonic())
+
+        for sentinel in wait(list(running)):
+            (job, process, log_path, started) = running.pop(sentinel)
+            process.join()
+            result = JobResult(job, process.exitcode, time.monotonic() - started)
+            results.append(result)
+            __print_job_log(result, log_path)
+
+    return sorted(results, key=lambda r: r.job.line)
+
+def print_job_results(results: list[JobResult]) -> None:
+    width = max([len(r.job.name()) for r in results] + [3])
+    print(f"{'Job':<{width}}  {'Status':<12}  Duration")
+    for result in results:
+        duration = str(timedelta(seconds=int(result.seconds)))
+        print(f"{result.job.name():<{width}}  {result.status():<12}  {duration}")
+
+
+def __can_start(job: Job, running_jobs: list[Job]) -> bool:
+    class_limit = max(1, RUN_CLASS_JOBS.get(job.resource_class, RUN_JOBS))
+    same_class = [j for j in running_jobs if j.resource_class == job.resource_class]
+    if len(same_class) >= class_limit:
+        return False
+    if job.resource_class == "disk" and any(j.username == job.username for j in same_class):
+        return False
+    return True
+
+def __run_job_in_child(job: Job, log_fd: int) -> None:
+    # stdin is closed off so a job that needs interactive setup
+    # fails rather than waiting on input that will never come
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(log_fd, 1)
+    os.dup2(log_fd, 2)
+    os.close(devnull)
+
+    service = resolve_service(job.service_slug)(job.username)
+    service.info()
+    try:
+        getattr(service, job.subcommand)(*job.args)
+    except KeyboardInterrupt:
+        print("Keyboard interrupt detected, exiting...")
+        sys.exit(130)
+
+def __print_job_log(result: JobResult, log_path: Path) -> None:
+    print(f"Finished '{result.job.name()}': {result.status()}")
+    try:
+        with open(log_path, "r", errors="replace") as f:
+            output = f.read()
+    finally:
+        log_path.unlink(missing_ok=True)
+    if output:
+        sys.stdout.write(output if output.endswith("\n") else output + "\n")
+    sys.stdout.flush()
+    logging.debug(f"Job '{result.job.name()}' took {result.seconds:.1f}s")
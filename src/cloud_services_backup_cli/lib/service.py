@@ -1,16 +1,28 @@
 from abc import ABC, abstractmethod
+import importlib
+
+from .timing import span, timed_run
 
 
 REGISTRY = {}
+MODULES = {}
 
 
 def register_service(slug: str):
     def wrapper(cls):
         REGISTRY[slug] = cls
+        cls.service_slug = slug
         return cls
     return wrapper
 
+def register_service_module(slug: str, module_name: str) -> None:
+    # Lets a service be resolved by slug without importing its
+    # module (and that module's dependencies) until it's needed
+    MODULES[slug] = module_name
+
 def resolve_service(slug: str) -> type:
+    if slug not in REGISTRY and slug in MODULES:
+        importlib.import_module(MODULES[slug])
     return REGISTRY[slug]
 
 def get_service_usage(service_type: type) -> str:
@@ -18,6 +30,14 @@ def get_service_usage(service_type: type) -> str:
 
 
 class Service(ABC):
+    # What a backup run is mostly bound by, used by 'run-all' to decide
+    # which jobs can run side by side (see lib/runner.py)
+    resource_class = "network"
+    service_slug = ""
+    # Whether the service runs rclone, so 'run-all' knows to start
+    # the rclone daemon its jobs share, if enabled (see tools/rclone.py)
+    uses_rclone = False
+
     def __init__(self, username: str):
         self.username = username
 
@@ -40,9 +60,14 @@ class Service(ABC):
         self.backup("sync", *args)
 
     def backup(self, subcommand: str, *args: str) -> None:
-        if self.setup_required():
-            self.setup(*args)
-        self._backup(subcommand, *args)
+        # Phases and subprocesses within the run are timed as spans
+        # (see lib/timing.py), summarized when the run finishes
+        with timed_run(self.service_slug or type(self).__name__, self.username, subcommand):
+            with span("setup"):
+                if self.setup_required():
+                    self.setup(*args)
+            with span("backup"):
+                self._backup(subcommand, *args)
 
     @abstractmethod
     def _backup(self, subcommand: str, *args: str) -> None:
@@ -0,0 +1,206 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import functools
+import json
+import logging
+import os
+import subprocess
+from subprocess import CompletedProcess
+import threading
+import time
+from typing import Iterator
+
+from .util import *
+from .metrics import write_run_metrics
+
+
+SPAN_LOCK = threading.Lock()
+
+
+@dataclass
+class Span:
+    # Wall and CPU time, plus bytes and files processed, for one phase of a
+    # run. Spans opened more than once under the same parent (e.g. per album,
+    # or per git command) are merged into one, with count saying how many
+    # times. CPU time includes subprocesses and worker processes that exited
+    # during the span, and is process-wide, so spans running concurrently on
+    # different threads each include the others' CPU time.
+    name: str
+    count: int = 0
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    bytes: int = 0
+    files: int = 0
+    children: list["Span"] = field(default_factory=list)
+
+    def add(self, bytes: int = 0, files: int = 0) -> None:
+        with SPAN_LOCK:
+            self.bytes += bytes
+            self.files += files
+
+    def child(self, name: str) -> "Span":
+        with SPAN_LOCK:
+            for child in self.children:
+                if child.name == name:
+                    return child
+            child = Span(name)
+            self.children.append(child)
+            return child
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "count": self.count,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "cpu_seconds": round(self.cpu_seconds, 3),
+            "bytes": self.bytes,
+            "files": self.files,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+@dataclass
+class RunReport:
+    service_slug: str
+    username: str
+    subcommand: str
+    started_at: datetime
+    root: Span
+    status: str = "running"  # "running", "succeeded", "failed" or "interrupted"
+    counters: dict[str, int] = field(default_factory=dict)  # See METRICS_COUNTERS
+
+    def to_dict(self) -> dict:
+        return {
+            "service": self.service_slug,
+            "username": self.username,
+            "subcommand": self.subcommand,
+            "started_at": self.started_at.isoformat(),
+            "status": self.status,
+            "counters": self.counters,
+            "span": self.root.to_dict(),
+        }
+
+
+# Open spans per thread. Threads that haven't opened a span of their own
+# (e.g. pool workers) record into whatever span the main thread has open.
+__spans_by_thread: dict[int, list[Span]] = {}
+__report: RunReport | None = None
+
+
+@contextmanager
+def timed_run(service_slug: str, username: str, subcommand: str) -> Iterator[RunReport]:
+    # Times a whole service run. When it's done, prints a summary of the
+    # spans recorded during the run and saves them as a JSON run report
+    # (see run_report_file) and Prometheus metrics (see metrics_file),
+    # whether or not the run succeeded.
+    global __report
+    report = RunReport(service_slug, username, subcommand,
+        datetime.now(timezone.utc), Span(f"{service_slug} {subcommand}"))
+    __spans_by_thread.clear()
+    __report = report
+    try:
+        with __open_span(report.root):
+            yield report
+        report.status = "succeeded"
+    except KeyboardInterrupt:
+        report.status = "interrupted"
+        raise
+    except BaseException as e:
+        report.status = "succeeded" if isinstance(e, SystemExit) and not e.code else "failed"
+        raise
+    finally:
+        __spans_by_thread.clear()
+        __report = None
+        print_run_summary(report)
+        write_run_report(report)
+        write_run_metrics(report)
+
+@contextmanager
+def span(name: str) -> Iterator[Span]:
+    # Times a phase within the current run, nested under whichever span is
+    # open. Outside of a run, the span is timed but not recorded anywhere.
+    parent = current_span()
+    with __open_span(parent.child(name) if parent else Span(name)) as s:
+        yield s
+
+def timed(name: str):
+    # Decorator form of span(), for methods that make up a phase
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def current_span() -> Span | None:
+    spans = (__spans_by_thread.get(threading.get_ident())
+        or __spans_by_thread.get(threading.main_thread().ident))
+    return spans[-1] if spans else None
+
+def span_add(bytes: int = 0, files: int = 0) -> None:
+    # Adds to the bytes/files counts of the current span, if there is one
+    s = current_span()
+    if s:
+        s.add(bytes, files)
+
+def report_count(name: str, value: int = 1) -> None:
+    # Adds to one of the current run's counters, if there is a run. Adding 0
+    # still records the counter, as having been counted and found nothing.
+    if __report is not None:
+        with SPAN_LOCK:
+            __report.counters[name] = __report.counters.get(name, 0) + value
+
+def run_command(name: str, cmd: list[str], **kwargs) -> CompletedProcess:
+    # subprocess.run, logged and timed as its own span, e.g. "rclone sync"
+    log_command(cmd)
+    with span(name):
+        return subprocess.run(cmd, **kwargs)
+
+
+def run_report_file(service_slug: str, username: str) -> Path:
+    return backup_datad("reports", f"{service_slug}.{slugify(username)}.json")
+
+def write_run_report(report: RunReport) -> None:
+    report_file = run_report_file(report.service_slug, report.username)
+    report_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = report_file.with_name(report_file.name + ".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(report.to_dict(), f, indent=2)
+    os.replace(tmp_file, report_file)
+    logging.debug(f"Saved run report to {report_file}")
+
+def print_run_summary(report: RunReport) -> None:
+    rows = list(__summary_rows(report.root, 0))
+    width = max(len(label) for label, _ in rows)
+    print(f"Run {report.status} in {report.root.wall_seconds:.1f}s:")
+    print(f"  {'Phase':<{width}}  {'Wall':>9}  {'CPU':>9}  {'Files':>8}  {'MB':>10}")
+    for label, s in rows:
+        print(f"  {label:<{width}}  {s.wall_seconds:>8.1f}s  {s.cpu_seconds:>8.1f}s"
+            + f"  {s.files if s.files else '':>8}  {f'{s.bytes / (1024 * 1024):.1f}' if s.bytes else '':>10}")
+
+
+def __summary_rows(s: Span, depth: int) -> Iterator[tuple[str, Span]]:
+    yield ("  " * depth + s.name + (f" (x{s.count})" if s.count > 1 else ""), s)
+    for child in s.children:
+        yield from __summary_rows(child, depth + 1)
+
+@contextmanager
+def __open_span(s: Span) -> Iterator[Span]:
+    spans = __spans_by_thread.setdefault(threading.get_ident(), [])
+    spans.append(s)
+    (wall_started, cpu_started) = (time.perf_counter(), __cpu_time())
+    try:
+        yield s
+    finally:
+        spans.pop()
+        with SPAN_LOCK:
+            s.count += 1
+            s.wall_seconds += time.perf_counter() - wall_started
+            s.cpu_seconds += __cpu_time() - cpu_started
+
+def __cpu_time() -> float:
+    # This process plus any child processes it has waited on
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
@@ -15,6 +15,21 @@ def backup_tmpd() -> Path:
     tmpd.mkdir(parents=True, exist_ok=True)
     return tmpd
 
+def env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        error(f"Environment variable {name} must be an integer")
+
+def env_bool(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
 def google_oauth_creds() -> tuple[str, str] | None:
     client_id = os.environ.get("GOOGLE_OAUTH_CLIENT_ID")
     client_secret = os.environ.get("GOOGLE_OAUTH_CLIENT_SECRET")
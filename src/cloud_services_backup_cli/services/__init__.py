@@ -1,5 +1,19 @@
-import importlib
-import pkgutil
+from ..lib import register_service_module
 
-for _, modname, _ in pkgutil.iter_modules(__path__):
-    importlib.import_module(f"{__name__}.{modname}")
+# Service modules are imported on demand when their slug is resolved,
+# so a run only pays for the dependencies of the service it uses
+SERVICE_MODULES = {
+    "bitbucket": "bitbucket",
+    "dropbox": "dropbox",
+    "github": "github",
+    "gmail": "gmail",
+    "google-calendar": "google_calendar",
+    "google-contacts": "google_contacts",
+    "google-drive": "google_drive",
+    "google-photos": "google_photos",
+    "google-takeout": "google_takeout",
+    "google-takeout-photos": "google_takeout_photos",
+}
+
+for slug, modname in SERVICE_MODULES.items():
+    register_service_module(slug, f"{__name__}.{modname}")
@@ -1,4 +1,4 @@
-import requests
+import math
 
 from ..lib import *
 from ..tools.git import *
@@ -16,8 +16,10 @@ Subcommands:
         to make API requests and clone repos.
   copy <atlassian_username>
         Fetches repos and clones them as bare repositories locally.
+        Skips repos with no updates since the last backup.
   sync <atlassian_username>
-        Removes local repos and re-clones all repos.
+        Fetches all repos, including those with no updates
+        since the last backup.
 
 API access tokens:
   Ensure you create an API access token with the following:
@@ -29,25 +31,28 @@ API access tokens:
         super().__init__("bitbucket", "bitbucket.org",
             require_username(username, "atlassian_username"))
 
-    def _get_repo_urls(self) -> list[str]:
+    def _get_repos(self) -> list[GitRepo]:
         repos_uri = "https://api.bitbucket.org/2.0/repositories?role=owner"
-        auth = self._get_credentials()
+        client = self._http_client()
         pagelen = 100
-        page = 1
-        repo_urls = []
-        while True:
-            response = requests.get(repos_uri,
-                params={'pagelen': pagelen, 'page': page},
-                auth=auth)
-            response.raise_for_status()
-            repos_on_page = response.json()['values']
-            for repo in repos_on_page:
+
+        # Bitbucket returns the total number of repos as 'size', so after the
+        # first page the rest can be fetched concurrently
+        def page_count(result: HttpResult) -> int | None:
+            if "size" not in result.data:
+                return None
+            return math.ceil(result.data["size"] / pagelen)
+
+        pages = client.get_json_pages(repos_uri,
+            params={'pagelen': pagelen},
+            page_count=page_count,
+            has_next=lambda result: "next" in result.data)
+
+        repos = []
+        for page in pages:
+            for repo in page.data['values']:
                 if repo['scm'] == 'git':
                     for clone_link in repo['links']['clone']:
                         if clone_link['name'] == 'https':
-                            repo_urls.append(clone_link['href'])
-
-            if len(repos_on_page) < pagelen:
-                break
-            page = page + 1
-        return repo_urls
+                            repos.append(GitRepo(clone_link['href'], repo.get('updated_on')))
+        return repos
@@ -28,10 +28,8 @@ Subcommands:
 
     def _backup(self, subcommand: str, *args: str) -> None:
         print(f"Starting rclone backup with {subcommand} command...")
-        rclone(
+        rclone_transfer(
             subcommand,
-            "--stats-log-level", "NOTICE",
-            "--stats", "1m",
             f"{self.rclone_remote}:/",
             f"{self.user_backupd}/",
         )
@@ -1,5 +1,3 @@
-import requests
-
 from ..lib import *
 from ..tools.git import *
 
@@ -16,8 +14,10 @@ Subcommands:
         to make API requests and clone repos.
   copy <github_username>
         Fetches repos and clones them as bare repositories locally.
+        Skips repos with no pushes since the last backup.
   sync <github_username>
-        Removes local repos and re-clones all repos.
+        Fetches all repos, including those with no pushes
+        since the last backup.
 
 Personal access tokens:
   Ensure you create personal access tokens with the following
@@ -30,23 +30,24 @@ Personal access tokens:
         super().__init__("github", "github.com",
             require_username(username, "github_username"))
 
-    def _get_repo_urls(self) -> list[str]:
+    def _get_repos(self) -> list[GitRepo]:
         repos_uri = "https://api.github.com/user/repos?type=owner"
-        auth = self._get_credentials()
-        headers = {'accept': 'application/vnd.github.v3+json'}
-        per_page = 100
-        page = 1
-        repo_urls = []
-        while True:
-            response = requests.get(repos_uri,
-                params={'per_page': per_page, 'page': page},
-                auth=auth,
-                headers=headers)
-            response.raise_for_status()
-            repos_on_page = response.json()
-            repo_urls.extend([repo["clone_url"] for repo in repos_on_page])
-
-            if len(repos_on_page) < per_page:
-                break
-            page = page + 1
-        return repo_urls
+        client = self._http_client(headers={'accept': 'application/vnd.github.v3+json'})
+
+        # GitHub returns the last page number in the Link header, so after the
+        # first page the rest can be fetched concurrently
+        def page_count(result: HttpResult) -> int | None:
+            links = http_link_urls(result.headers)
+            if "last" in links:
+                return int(http_query_param(links["last"], "page"))
+            return None if "next" in links else 1
+
+        pages = client.get_json_pages(repos_uri,
+            params={'per_page': 100},
+            page_count=page_count,
+            has_next=lambda result: "next" in http_link_urls(result.headers))
+
+        repos = []
+        for page in pages:
+            repos.extend([GitRepo(repo["clone_url"], repo.get("pushed_at")) for repo in page.data])
+        return repos
@@ -37,10 +37,8 @@ OAuth2 authentication:
 
     def _backup(self, subcommand: str, *args: str) -> None:
         print(f"Starting rclone backup with {subcommand} command...")
-        rclone(
+        rclone_transfer(
             subcommand,
-            "--stats-log-level", "NOTICE",
-            "--stats", "1m",
             "--exclude", "/Google Photos/",
             "--exclude", "/Takeout/",
             f"{self.rclone_remote}:/",
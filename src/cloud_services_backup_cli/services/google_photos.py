@@ -51,10 +51,8 @@ OAuth2 authentication:
             flags += ["--ignore-existing"]
 
         print(f"Starting rclone backup with {subcommand} command...")
-        rclone(
+        rclone_transfer(
             subcommand,
-            "--stats-log-level", "NOTICE",
-            "--stats", "1m",
             *flags,
             f"{self.rclone_remote}:/media/by-year/{year}/",
             f"{year_backupd}/",
@@ -1,18 +1,23 @@
 from __future__ import annotations
 from abc import abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from dataclasses import dataclass, field
+import json
 import logging
+import os
 import shutil
-import tarfile
-import zipfile
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 
 from ..lib import *
+from ..tools.archive import *
 from ..tools.rclone import *
-from ..tools.rsync import *
+from ..tools.sync import *
 
 
 CLEANUP_REMOTE_AGE_DAYS = 7
+TAKEOUT_STREAM = env_bool("CLOUD_BACKUP_TAKEOUT_STREAM")
+TAKEOUT_EXTRACT_JOBS = env_int("CLOUD_BACKUP_TAKEOUT_EXTRACT_JOBS", 4)
+TAKEOUT_LINK = env_bool("CLOUD_BACKUP_TAKEOUT_LINK")
 
 
 @register_service("google-takeout")
@@ -50,12 +55,41 @@ How this works:
   the 'Takeout' folder in Google Drive into a local 'archives' folder.
   Will delete any local archive files that were removed from Google Drive.
 - Detects which archive files belong to the same export and extracts
-  them into "joined" export folders in the 'archives' folder.
+  them into "joined" export folders in the 'archives' folder. Archive
+  files for an export are extracted in parallel, up to the number of
+  CPUs or CLOUD_BACKUP_TAKEOUT_EXTRACT_JOBS (default 4), whichever
+  is lower. .tgz files are decompressed with igzip or pigz if either
+  is installed, which can be overridden with CLOUD_BACKUP_GZIP_TOOL
+  (a tool name, or 'python' for the built-in decompressor).
+- Keeps a journal of the archive files that have been fully extracted
+  for each export (by name, size and modification time), so that only
+  new or changed archive files are extracted on the next run, and an
+  interrupted extraction resumes where it left off. When an archive file
+  has changed, files in it that are unchanged (same size and modification
+  time as in the export folder) aren't written again, and files that
+  were only in its old version are deleted from the export folder, as
+  are files from archive files that were removed, going by the index.
+- With CLOUD_BACKUP_TAKEOUT_LINK=1, files are hard-linked rather than
+  copied between the export folders and the 'takeout' backup folder:
+  while extracting, files that are identical to the file at the same
+  path in the backup folder (same size and modification time, then
+  confirmed by comparing contents) are hard-linked to it rather than
+  written out again, and new files are hard-linked into the backup
+  folder when syncing. Unchanged files are then only stored once, but
+  the backup and export folders share those files, so changing one in
+  place changes it in both, and deleting an export folder doesn't free
+  their space. By default, the backup folder gets its own copies.
+- Keeps an index of the files in each export's archive files (path,
+  size and modification time) in '<export>.index.json.gz', built while
+  extracting, or by scanning archive headers for archive files that
+  haven't been extracted. Used to find albums and product folders, and
+  which files changed, without reading the extracted folders.
 - Will clean up any export folders that no longer have corresponding
   archive files.
 - Syncs files from each export into the 'takeout' backup folder.
 - Syncs files by Google product folder, so that product folders
-  that aren't included in the export are not touched.
+  that aren't included in the export are not touched. In 'copy' mode,
+  product folders with no new or changed files are skipped.
 - Will only overwrite files where the modification time is newer
   than the existing file in the backup folder.
 - In 'sync' mode, will delete files in the backup folder that were
@@ -63,6 +97,16 @@ How this works:
   included in the export.
 - Will remove archive files in Google Drive that have been successfully
   processed and are older than 7 days.
+- Alternately, with CLOUD_BACKUP_TAKEOUT_STREAM=1, archive files are
+  read in a single pass and each file is written straight into the
+  'takeout' backup folder using the same update rules, without
+  extracting exports into the 'archives' folder first. Archive files
+  that have been streamed are recorded (by name, size and modification
+  time) in an '<export>.streamed.json' file, so only new or changed
+  archive files of an export are streamed on the next run. In 'sync'
+  mode, all of an export's archive files are read again when any of
+  them is new or changed, since deleting files removed from the export
+  needs the full list of files in it.
 
 OAuth2 authentication:
   If you are providing your own Google OAuth2 client (via environment
@@ -71,6 +115,7 @@ OAuth2 authentication:
   https://rclone.org/drive/#making-your-own-client-id
     """
     SYNC_SUBDIRS_FOR = ["Google Photos"]
+    resource_class = "disk"
 
     def __init__(self, username: str):
         super().__init__(
@@ -109,33 +154,75 @@ OAuth2 authentication:
     def list_extract_dirs(self) -> list[Path]:
         return list_subdirs(self.user_backupd_archives)
 
-    def sync_archives_from_remote(self, subcommand: str) -> None:
+    def get_export_index(self, export: GoogleTakeoutExport) -> ArchiveIndex:
+        # Loads the export's index, scanning any archive files that are
+        # new or changed since it was last updated
+        index = ArchiveIndex(export.index_file())
+        if not all(index.is_current(archive) for archive in export.archives):
+            print(f"Indexing archives for export '{export.name}'...")
+        jobs = max(1, min(os.cpu_count() or 1, TAKEOUT_EXTRACT_JOBS))
+        failed = index.update(export.archives, jobs)
+        index.save()
+        if failed:
+            error(f"Failed to index archives for export {export.name}: {', '.join(failed)}")
+        return index
+
+    def list_changed_members(self, index: ArchiveIndex, relative_dir: str) -> list[ArchiveMember]:
+        # Files under a folder in the export (relative to 'Takeout') that are
+        # new or newer than the backup, going by the index alone
+        return [
+            member for _, member in index.members(f"Takeout/{relative_dir}")
+                if not member.is_dir
+                    and is_archive_member_newer(member, self.user_backupd_files.joinpath(*member.parts()[1:]))
+        ]
+
+    @timed("download archives")
+    def sync_archives_from_remote(self, subcommand: str) -> RcloneStats:
         print(f"Starting rclone sync to download/sync archives...")
-        rclone(
+        return rclone_transfer(
             "sync",
-            "--stats-log-level", "NOTICE",
-            "--stats", "1m",
             "--include", "takeout-*.tgz", "--include", "takeout-*.zip",
             f"{self.rclone_remote}:/Takeout/",
             f"{self.user_backupd_archives}/",
         )
 
-    def extract_archives(self, subcommand) -> None:
+    @timed("extract archives")
+    def extract_archives(self, subcommand, include_folders: list[str] | None = None) -> None:
+        # include_folders limits extraction to members under those folders in the
+        # archives (matched case-insensitively), e.g. ["Takeout/Google Photos/Trip"]
         print("Extracting archives...")
         for export in self.list_exports():
-            if not export.extract_dir.exists():
-                self.__extract_archives_for_export(export)
-            else:
-                logging.debug(f"Skipping {export.name}, extract folder already exists")
-        
+            self.__extract_archives_for_export(export, include_folders)
+
         self.__cleanup_extract_dirs()
 
-    def cleanup_archives_from_remote(self) -> None:
+    @timed("stream archives")
+    def stream_archives_to_backup(self, subcommand: str) -> None:
+        print("Streaming archives into backup...")
+        for export in self.list_exports():
+            journal = self.__read_journal(export.stream_journal_file())
+            journal = { name: entry for name, entry in journal.items()
+                if any(archive.name == name for archive in export.archives) }
+            pending = [archive for archive in export.archives
+                if not self.__is_same_archive(journal.get(archive.name), self.__get_archive_journal_entry(archive))]
+            if not pending:
+                logging.debug(f"Skipping {export.name}, all archives already streamed")
+                continue
+
+            # Parts are only recorded once the whole export has been streamed
+            # (and extraneous files deleted), so an interrupted run starts over
+            self.__stream_export_to_backup(subcommand, export, export.archives if subcommand == "sync" else pending)
+            for archive in pending:
+                journal[archive.name] = self.__get_archive_journal_entry(archive)
+            self.__write_journal(export.stream_journal_file(), journal)
+
+        self.__cleanup_extract_dirs()
+
+    @timed("clean up remote")
+    def cleanup_archives_from_remote(self) -> RcloneStats:
         print(f"Deleting archive files older than {CLEANUP_REMOTE_AGE_DAYS} day(s) from Google Drive using rclone...")
-        rclone(
+        return rclone_transfer(
             "delete",
-            "--stats-log-level", "NOTICE",
-            "--stats", "1m",
             "--include", "takeout-*.tgz", "--include", "takeout-*.zip",
             "--min-age", f"{CLEANUP_REMOTE_AGE_DAYS}d",
             f"{self.rclone_remote}:/Takeout/"
@@ -150,33 +237,182 @@ OAuth2 authentication:
 
     def _backup(self, subcommand: str, *args: str) -> None:
         self.sync_archives_from_remote(subcommand)
-        self.extract_archives(subcommand)
-        self.__sync_exports_to_backup(subcommand)
+        if TAKEOUT_STREAM:
+            self.stream_archives_to_backup(subcommand)
+        else:
+            self.extract_archives(subcommand)
+            self.__sync_exports_to_backup(subcommand)
         self.cleanup_archives_from_remote()
 
 
-    def __extract_archives_for_export(self, export: GoogleTakeoutExport) -> None:
-        print(f"Extracting archives for export '{export.name}'...")
+    def __extract_archives_for_export(self, export: GoogleTakeoutExport, include_folders: list[str] | None) -> None:
+        # Parts of an export hold disjoint sets of files, so they're extracted
+        # concurrently, bounded by CPU count (decompression) and
+        # CLOUD_BACKUP_TAKEOUT_EXTRACT_JOBS (disk I/O). Each part is recorded
+        # in the export's journal once it's fully extracted, so parts that are
+        # unchanged since then are skipped, and a failed or interrupted part
+        # is extracted again next run without redoing the others.
+        #
+        # When limited to include_folders, the journal also records which folders
+        # a part was extracted for, and parts that the index shows have nothing
+        # in those folders are recorded as done without being read at all.
+        journal = self.__read_journal(export.extract_journal_file())
+        index = ArchiveIndex(export.index_file())
+        stale_files = self.__clear_stale_parts(export, journal, index)
+        pending = [archive for archive in export.archives
+            if not self.__is_extracted(journal.get(archive.name), archive, include_folders)]
+
+        if include_folders is not None:
+            for archive in [a for a in pending if index.is_current(a)]:
+                if any(is_member_in_folders(m, include_folders) for m in index.archive_members(archive.name)): continue
+                logging.debug(f"Skipping {archive.name}, nothing to extract in {', '.join(include_folders)}")
+                journal[archive.name] = self.__get_extract_journal_entry(archive, journal.get(archive.name), include_folders)
+                pending.remove(archive)
+                export.extract_dir.mkdir(parents=True, exist_ok=True)
+                self.__write_journal(export.extract_journal_file(), journal)
+        if not pending:
+            logging.debug(f"Skipping {export.name}, all archives already extracted")
+            return
+
+        print(f"Extracting {len(pending)} of {len(export.archives)} archive(s) for export '{export.name}'"
+            + (f", limited to {', '.join(include_folders)}" if include_folders is not None else "") + "...")
         export.extract_dir.mkdir(parents=True, exist_ok=True)
+        jobs = max(1, min(os.cpu_count() or 1, TAKEOUT_EXTRACT_JOBS, len(pending)))
+        failed = False
+        not_attempted = []
+        total_linked = 0
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {}
+            # Archives are reported as they finish rather than as they're queued,
+            # since all of them are queued up front
+            for archive in pending:
+                logging.debug(f"Queueing {archive.name} for extraction")
+                future = executor.submit(
+                    extract_archive, archive.resolve(), export.extract_dir.resolve(),
+                    self.user_backupd_files.resolve() if TAKEOUT_LINK else None, "Takeout", include_folders)
+                futures[future] = archive
+            running = set(futures)
+            while running:
+                (done, running) = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    archive = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logging.error(f"Failed to extract {archive.name}: {e}")
+                        failed = True
+                        # Archives that haven't started yet are left for the next run,
+                        # while those already extracting are let finish. Cancelled
+                        # futures never complete, so they're no longer waited on.
+                        not_attempted += [futures[f].name for f in running if f.cancel()]
+                        running = set(f for f in running if not f.cancelled())
+                        continue
+                    if archive.name in stale_files:
+                        extracted = set(m.name for m in result.members
+                            if include_folders is None or is_member_in_folders(m, include_folders))
+                        self.__delete_stale_files(export, stale_files[archive.name] - extracted)
+                    journal[archive.name] = self.__get_extract_journal_entry(archive, journal.get(archive.name), include_folders)
+                    self.__write_journal(export.extract_journal_file(), journal)
+                    index.put(archive, result.members)
+                    total_linked += result.bytes_linked
+                    span_add(result.bytes_written + result.bytes_linked,
+                        sum(1 for m in result.members if not m.is_dir) - result.members_skipped - result.members_unchanged)
+                    mb = (result.bytes_written + result.bytes_linked) / (1024 * 1024)
+                    print(f"Extracted archive {archive.name}, {mb:.1f} MB in {result.seconds:.1f}s ({mb / max(result.seconds, 0.001):.1f} MB/s)"
+                        + (f", {result.bytes_linked / (1024 * 1024):.1f} MB linked to existing backup files" if result.bytes_linked else "")
+                        + (f", {result.members_unchanged} unchanged member(s) left in place" if result.members_unchanged else "")
+                        + (f", {result.members_skipped} member(s) skipped" if result.members_skipped else ""))
+
+        index.save()
+        if total_linked:
+            print(f"Reclaimed {total_linked / (1024 * 1024):.1f} MB by hard-linking files unchanged since the last export")
+        if not_attempted:
+            print(f"Skipped {len(not_attempted)} archive(s) not yet started when extraction failed: {', '.join(sorted(not_attempted))}")
+        if failed:
+            error(f"Failed to extract archives for export {export.name}, will retry failed archives next run")
+
+    def __clear_stale_parts(
+        self, export: GoogleTakeoutExport, journal: dict[str, dict], index: ArchiveIndex
+    ) -> dict[str, set[str]]:
+        # Deletes the files extracted from parts that have been removed since, so
+        # they aren't synced into the backup, and drops them from the journal.
+        # For parts that have changed, returns the files extracted from their old
+        # version, which are deleted once the new version is extracted, unless
+        # they're still in it (see __delete_stale_files). The index knows which
+        # files those were as long as it still describes the extracted version.
+        archives = { archive.name: archive for archive in export.archives }
+        stale_files = {}
+        for name, entry in list(journal.items()):
+            archive = archives.get(name)
+            if archive is not None and self.__is_same_archive(entry, self.__get_archive_journal_entry(archive)):
+                continue
+            indexed = index.archives.get(name)
+            if indexed is None or not self.__is_same_archive(entry, indexed):
+                logging.warning(f"Can't tell which files were extracted from {name}, leaving them in {export.extract_dir.name}")
+                files = set()
+            else:
+                folders = entry.get("folders")
+                files = set(m.name for m in index.archive_members(name)
+                    if not m.is_dir and (folders is None or is_member_in_folders(m, folders)))
+            if archive is not None:
+                stale_files[name] = files
+                continue
+            print(f"Deleting {len(files)} file(s) extracted from removed archive {name}...")
+            self.__delete_stale_files(export, files)
+            del journal[name]
+            self.__write_journal(export.extract_journal_file(), journal)
+        return stale_files
+
+    def __delete_stale_files(self, export: GoogleTakeoutExport, files: set[str]) -> None:
+        for name in files:
+            export.extract_dir.joinpath(name).unlink(missing_ok=True)
+
+    def __get_extract_journal_entry(
+        self, archive: Path, prev_entry: dict | None = None, include_folders: list[str] | None = None
+    ) -> dict:
+        # 'folders' is None once a part has been fully extracted, otherwise
+        # the (lowercase) folders it has been extracted for so far
+        entry = { **self.__get_archive_journal_entry(archive), "folders": None }
+        if include_folders is not None:
+            folders = set(f.lower().rstrip("/") for f in include_folders)
+            if self.__is_same_archive(prev_entry, entry):
+                if prev_entry.get("folders") is None:
+                    return entry
+                folders.update(prev_entry["folders"])
+            entry["folders"] = sorted(folders)
+        return entry
+
+    def __get_archive_journal_entry(self, archive: Path) -> dict:
+        stat = archive.stat()
+        return { "size": stat.st_size, "mtime": stat.st_mtime }
+
+    def __is_extracted(self, entry: dict | None, archive: Path, include_folders: list[str] | None) -> bool:
+        if not self.__is_same_archive(entry, self.__get_extract_journal_entry(archive)):
+            return False
+        if entry.get("folders") is None:
+            return True
+        return include_folders is not None and set(f.lower().rstrip("/") for f in include_folders) <= set(entry["folders"])
+
+    def __is_same_archive(self, entry: dict | None, other: dict) -> bool:
+        return entry is not None and entry["size"] == other["size"] and entry["mtime"] == other["mtime"]
+
+    def __read_journal(self, journal_file: Path) -> dict[str, dict]:
+        # Exports extracted or streamed before their journal existed have no
+        # record of which parts they hold, so all of their parts are done again
+        if not journal_file.exists():
+            return {}
         try:
-            for archive in export.archives:
-                self.__extract_archive(archive, export.extract_dir)
-        except Exception as e:
-            shutil.rmtree(export.extract_dir.resolve(), ignore_errors=True)
-            error(f"Failed to extract archives for export {export.name}, cleaned up extract folder")
+            with open(journal_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable journal {journal_file}, all parts will be done again: {e}")
+            return {}
 
-    def __extract_archive(self, archive: Path, extract_dir: Path) -> None:
-        print(f"Extracting archive {archive.name}...")
-        try:
-            if archive.name.endswith(".tgz"):
-                with tarfile.open(archive.resolve(), "r:gz") as tar:
-                    tar.extractall(path=extract_dir.resolve())
-            elif archive.name.endswith(".zip"):
-                with zipfile.ZipFile(archive.resolve(), "r") as zip_ref:
-                    zip_ref.extractall(extract_dir.resolve())
-        except Exception as e:
-            logging.error(f"Failed to extract {archive.name}: {e}")
-            raise
+    def __write_journal(self, journal_file: Path, journal: dict[str, dict]) -> None:
+        tmp_file = journal_file.with_name(journal_file.name + ".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(journal, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, journal_file)
 
 
     def __cleanup_extract_dirs(self) -> None:
@@ -189,7 +425,17 @@ OAuth2 authentication:
                 print(f"Deleting folder {extract_dir.name}, no corresponding archive found...")
                 shutil.rmtree(extract_dir.resolve(), ignore_errors=True)
 
+        for export_file in [*self.user_backupd_archives.glob("*.streamed"), *self.user_backupd_archives.glob("*.streamed.json"), *self.user_backupd_archives.glob("*.index.json.gz")]:
+            export_name = export_file.name.split(".")[0]
+            archive_file_exists = any(
+                entry.name.startswith(export_name) and entry.suffix in (".tgz", ".zip")
+                    for entry in self.user_backupd_archives.iterdir()
+            )
+            if not archive_file_exists:
+                export_file.unlink()
+
 
+    @timed("sync to backup")
     def __sync_exports_to_backup(self, subcommand: str) -> None:
         print("Backing up takeout files...")
         for export in self.list_exports():
@@ -197,27 +443,112 @@ OAuth2 authentication:
             if not source_root_dir.exists() or not source_root_dir.is_dir(): continue
 
             print(f"Synchronizing files from export '{export.name}'...")
-            
+            index = self.get_export_index(export)
+
             # Go one-by-one through Google product folders in source export,
             # so we don't remove any product folders that aren't in this export
-            for source_product_dir in list_subdirs(source_root_dir):
-                if source_product_dir.name not in self.SYNC_SUBDIRS_FOR:
-                    self.__sync_export_subdir_to_backup(subcommand, source_root_dir, self.user_backupd_files, source_product_dir.name)
+            relative_dirs = []
+            for product_name in index.subdirs("Takeout"):
+                if product_name not in self.SYNC_SUBDIRS_FOR:
+                    relative_dirs.append(product_name)
                 else:
-                    for source_product_subdir in list_subdirs(source_product_dir):
-                        self.__sync_export_subdir_to_backup(subcommand, source_root_dir, self.user_backupd_files, f"{source_product_dir.name}/{source_product_subdir.name}")
+                    relative_dirs += [f"{product_name}/{name}" for name in index.subdirs(f"Takeout/{product_name}")]
+
+            for relative_dir in relative_dirs:
+                # Nothing to copy if the index shows no new or changed files. In 'sync'
+                # mode the folder is still synced, to delete files removed in the export.
+                if subcommand == "copy" and not self.list_changed_members(index, relative_dir):
+                    print(f"No changes in '{relative_dir}'")
+                    continue
+                self.__sync_export_subdir_to_backup(subcommand, source_root_dir, self.user_backupd_files, relative_dir)
+
+    def __stream_export_to_backup(self, subcommand: str, export: GoogleTakeoutExport, archives: list[Path]) -> None:
+        # Single pass over the archive members, writing each file straight into
+        # the backup folder. Applies the same rules as __sync_exports_to_backup:
+        # files are grouped into the same product (or Google Photos album) folders
+        # that get synced, only overwritten when newer ('--update'), and in 'sync'
+        # mode anything in those folders that isn't in the export is deleted.
+        print(f"Streaming archives for export '{export.name}'...")
+        seen_paths = {}  # sync folder -> relative paths in the export
+        (written, unchanged, added, written_bytes) = (0, 0, 0, 0)
+        try:
+            for archive in archives:
+                print(f"Streaming archive {archive.name}...")
+                for member, fileobj in iter_archive(archive.resolve()):
+                    relative_path = self.__get_backup_relative_path(member)
+                    if relative_path is None: continue
+                    (sync_dir, relative_path) = relative_path
+                    seen_paths.setdefault(sync_dir, set()).add(relative_path)
+
+                    dest_file = self.user_backupd_files.joinpath(relative_path)
+                    if member.is_dir:
+                        dest_file.mkdir(parents=True, exist_ok=True)
+                    elif is_archive_member_newer(member, dest_file):
+                        existed = dest_file.exists()
+                        write_archive_member(member, fileobj, dest_file)
+                        logging.debug(f"Wrote '{relative_path}'")
+                        span_add(member.size, 1)
+                        written += 1
+                        added += 0 if existed else 1
+                        written_bytes += member.size
+                    else:
+                        unchanged += 1
+        except Exception as e:
+            logging.error(f"Failed to stream archives for export {export.name}: {e}")
+            error(f"Failed to stream archives for export {export.name}")
+        report_count("bytes_transferred", written_bytes)
+        report_count("files_added", added)
+        report_count("files_updated", written - added)
+
+        deleted = 0
+        if subcommand == "sync":
+            for sync_dir, relative_paths in seen_paths.items():
+                deleted += self.__delete_extraneous_files(sync_dir, relative_paths)
+        report_count("files_deleted", deleted)
+        print(f"Wrote {written} file(s), {unchanged} unchanged, {deleted} deleted")
+
+    def __get_backup_relative_path(self, member: ArchiveMember) -> tuple[str, str] | None:
+        # Maps an archive member to (sync folder, path relative to backup folder),
+        # or None for members that __sync_exports_to_backup wouldn't sync
+        parts = member.parts()
+        if len(parts) < 2 or parts[0] != "Takeout":
+            return None
+        parts = parts[1:]
+        depth = 2 if parts[0] in self.SYNC_SUBDIRS_FOR else 1
+        if len(parts) < depth or (len(parts) == depth and not member.is_dir):
+            return None
+        return ("/".join(parts[:depth]), "/".join(parts))
+
+    def __delete_extraneous_files(self, sync_dir: str, relative_paths: set[str]) -> int:
+        # Equivalent of 'rsync --delete' for a single sync folder
+        keep = set(relative_paths)
+        for relative_path in relative_paths:
+            keep.update(str(p) for p in PurePosixPath(relative_path).parents)
+
+        deleted = 0
+        dest_root = self.user_backupd_files.joinpath(sync_dir)
+        for dir_path, dir_names, file_names in os.walk(dest_root, topdown=False):
+            for name in file_names + dir_names:
+                path = Path(dir_path, name)
+                if path.relative_to(self.user_backupd_files).as_posix() in keep: continue
+                if path.is_dir() and not path.is_symlink():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink(missing_ok=True)
+                logging.debug(f"Deleted '{path.relative_to(self.user_backupd_files)}'")
+                deleted += 1
+        return deleted
 
     def __sync_export_subdir_to_backup(self, subcommand: str, source_root_dir: Path, dest_root_dir: Path, relative_dir: str) -> None:
         source_dir = source_root_dir.joinpath(relative_dir)
         dest_dir = dest_root_dir.joinpath(relative_dir)
-        dest_dir.mkdir(parents=True, exist_ok=True)
 
-        rsync_flags = ["--archive", "--update"]
-        if subcommand == "sync":
-            rsync_flags.append("--delete")
-        
+        # Files are only hard-linked from the export when enabled (see
+        # TAKEOUT_LINK), since the backup then shares them with the export
         print(f"Synchronizing files in '{relative_dir}'...")
-        rsync(*rsync_flags, "-v", f"{source_dir}/", f"{dest_dir}/")
+        result = sync_tree(source_dir, dest_dir, update=True, delete=(subcommand == "sync"), link=TAKEOUT_LINK)
+        result.log_changes()
+        print(f"Synchronized '{relative_dir}': {result.summary()}")
 
 
 @dataclass
@@ -229,8 +560,20 @@ class GoogleTakeoutExport:
     def takeout_root_dir(self):
         return self.extract_dir.joinpath("Takeout")
 
+    def index_file(self):
+        return self.extract_dir.with_name(f"{self.extract_dir.name}.index.json.gz")
+
+    def extract_journal_file(self):
+        return self.extract_dir.joinpath(".extract-journal.json")
+
+    def stream_journal_file(self):
+        return self.extract_dir.with_name(f"{self.extract_dir.name}.streamed.json")
+
 
 class GoogleTakeoutAddonService(Service):
+    resource_class = "disk"
+    uses_rclone = True
+
     def __init__(self, app_slug: str, username: str):
         super().__init__(
             require_username(username, "google_username", "gmail.com"))
@@ -254,10 +597,15 @@ class GoogleTakeoutAddonService(Service):
 
     def _backup(self, subcommand: str, *args: str) -> None:
         self.google_takeout.sync_archives_from_remote(subcommand)
-        self.google_takeout.extract_archives(subcommand)
+        self.google_takeout.extract_archives(subcommand, self._get_extract_folders(*args))
         self._backup_takeout_files(subcommand, *args)
         self.google_takeout.cleanup_archives_from_remote()
 
+    def _get_extract_folders(self, *args: str) -> list[str] | None:
+        # Folders in the archives that this service needs extracted,
+        # or None for everything
+        return None
+
     @abstractmethod
     def _backup_takeout_files(self, subcommand: str, *args: str) -> None:
         raise NotImplementedError()
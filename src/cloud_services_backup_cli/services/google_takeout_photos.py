@@ -1,13 +1,20 @@
+import hashlib
+import os
 from pathlib import Path
 import re
-import tempfile
 
 from ..lib import *
-from ..tools.rsync import *
+from ..tools.archive import *
 from ..tools.media import *
+from ..tools.sync import *
 from .google_takeout import *
 
 
+MEDIA_JOBS = env_int("CLOUD_BACKUP_MEDIA_JOBS", os.cpu_count() or 1)
+MEDIA_CACHE_SIZE = env_int("CLOUD_BACKUP_MEDIA_CACHE_SIZE", 250000)
+MEDIA_CACHE_HASH = env_bool("CLOUD_BACKUP_MEDIA_CACHE_HASH")
+
+
 @register_service("google-takeout-photos")
 class GoogleTakeoutPhotos(GoogleTakeoutAddonService):
     """
@@ -38,7 +45,8 @@ Subcommands:
 How this works:
 - Downloads, extracts, and manages Google Takeout archives just
   as described in the 'google-takeout' service (see help).
-  After that...
+  If albums are specified on the command line, only those albums
+  are extracted from the archives. After that...
 - Scans all export folders for Google Photos albums and syncs them
   into the 'albums' folder in the backup dir. Will only sync the 
   latest export it can find *for each album*.
@@ -47,6 +55,10 @@ How this works:
   files where the modification time is newer than the existing file
   and will delete files that were removed in the export for that
   album. Albums that aren't included in the export are not touched.
+- Skips albums that haven't changed since they were last synced, going
+  by a fingerprint.txt file in each album folder that records the export
+  the album came from, the mode ('copy' or 'sync') and a digest of the
+  names, sizes and modification times of the album's files in the export.
 - Generates a manifest.txt file in each album folder that lists
   all media files in the album, organized by year/month.
 - Year/month is determined by the creation date of the media file.
@@ -54,6 +66,9 @@ How this works:
   EXIF metadata, video container metadata, JSON metadata, file
   name patterns, and finally falling back to shelling out to
   exiftool.
+- Create dates are cached in 'timestamp-cache.json' in the backup
+  dir, keyed by inode, size and mtime, so the same photo in several
+  albums (or a renamed album) is only read once.
 - Then, syncs media files and JSON metadata files from the album
   to the 'library' folder by date and month, as specified in the
   manifest file, using hard links to avoid using additional
@@ -63,6 +78,22 @@ How this works:
   'sync' mode, will overwrite hard links where the modification
   time is newer than the existing hard link and/or the file size
   is different.
+- With CLOUD_BACKUP_TAKEOUT_LINK=1, media and metadata files are
+  hard-linked into the album folders from the google-takeout backup
+  rather than copied, so they share the same files (see
+  'google-takeout help').
+
+Environment variables:
+  CLOUD_BACKUP_MEDIA_JOBS
+        Number of worker processes used to extract create timestamps
+        from new media files. Defaults to the number of CPUs.
+  CLOUD_BACKUP_MEDIA_CACHE_SIZE
+        Maximum number of entries kept in the create date cache.
+        Defaults to 250000.
+  CLOUD_BACKUP_MEDIA_CACHE_HASH
+        If set to 1, also keys the create date cache by a hash of
+        file contents, so separate copies of the same photo share an
+        entry. Costs a full read of each new file.
 
 OAuth2 authentication:
   If you are providing your own Google OAuth2 client (via environment
@@ -78,29 +109,48 @@ OAuth2 authentication:
         
         self.user_backupd_albums = self.user_backupd.joinpath("albums")
         self.user_backupd_library = self.user_backupd.joinpath("library")
+        self.timestamp_cache_file = self.user_backupd.joinpath("timestamp-cache.json")
+        self.timestamp_cache = None
 
         self.user_backupd_albums.mkdir(parents=True, exist_ok=True)
         self.user_backupd_library.mkdir(parents=True, exist_ok=True)
 
+    def _get_extract_folders(self, *args: str) -> list[str] | None:
+        # When albums are given on the command line, only extract those albums
+        if not len(args):
+            return None
+        return [f"Takeout/Google Photos/{a.strip()}" for a in args]
+
     def _backup_takeout_files(self, subcommand: str, *args: str) -> None:
         print("Backing up from local takeout backup...")
-        self.__sync_exports_to_albums(subcommand, *args)
+        self.timestamp_cache = MediaTimestampCache(
+            self.timestamp_cache_file, MEDIA_CACHE_SIZE, MEDIA_CACHE_HASH)
+        try:
+            self.__sync_exports_to_albums(subcommand, *args)
+        finally:
+            exiftool_close()
+            self.timestamp_cache.save()
+            print(f"Timestamp cache: {self.timestamp_cache.stats()}")
 
 
-    def __list_albums_to_sync(self, *args: str) -> list[(GoogleTakeoutExport, Path)]:
+    def __list_albums_to_sync(self, *args: str) -> list[(GoogleTakeoutExport, Path, str)]:
         # Build a dict keyed by album name so that if the same album appears in
         # multiple exports, the last export seen wins. Exports are iterated in
         # chronological order (their names are timestamps), so this naturally
         # selects the most recent export for each album.
+        #
+        # Albums are found in each export's index rather than its extract folder,
+        # along with a digest of each album's file names, sizes and mtimes.
         albums_dict = {}
 
         for export in self.google_takeout.list_exports():
             albums_root_dir = export.takeout_root_dir().joinpath("Google Photos")
-            if not albums_root_dir.exists() or not albums_root_dir.is_dir(): continue
+            index = self.google_takeout.get_export_index(export)
+            digests = self.__get_album_digests(index)
 
-            for album_dir in list_subdirs(albums_root_dir):
-                albums_dict[album_dir.name] = (export, album_dir)
-                logging.debug(f"Found album '{album_dir.name}' in export '{export.name}'")
+            for album_name in index.subdirs("Takeout/Google Photos"):
+                albums_dict[album_name] = (export, albums_root_dir.joinpath(album_name), digests.get(album_name, ""))
+                logging.debug(f"Found album '{album_name}' in export '{export.name}'")
 
         albums_list = sorted(albums_dict.values(), key=lambda x: (x[0].name, x[1].name))
         if len(args):
@@ -108,46 +158,80 @@ OAuth2 authentication:
             args_lower = set(a.lower().strip() for a in args)
             albums_list = [a for a in albums_list if a[1].name.lower().strip() in args_lower]
         [logging.debug(f"Will sync album '{source_album_dir.name}' from export '{export.name}'")
-            for (export, source_album_dir) in albums_list]
+            for (export, source_album_dir, _) in albums_list]
 
         return albums_list
 
+    def __get_album_digests(self, index: ArchiveIndex) -> dict[str, str]:
+        # One pass over the index, rather than one query per album
+        hashes = {}
+        for _, member in index.members("Takeout/Google Photos"):
+            parts = member.parts()
+            if member.is_dir or len(parts) < 4: continue
+            line = f"{'/'.join(parts[3:])}\t{member.size}\t{int(member.mtime)}\n"
+            hashes.setdefault(parts[2], hashlib.sha256()).update(line.encode())
+        return { album_name: h.hexdigest() for album_name, h in hashes.items() }
+
 
     def __sync_exports_to_albums(self, subcommand: str, *args: str) -> None:
+        # An album is skipped if its fingerprint matches the one written the last
+        # time it was synced, i.e. it comes from the same export, in the same mode,
+        # with the same files. The fingerprint is only written once an album has
+        # been fully synced, so albums with failures are retried next run.
+        skipped = 0
         for album in self.__list_albums_to_sync(*args):
-            (export, source_album_dir) = album
-            print(f"Synchronizing album '{source_album_dir.name}' in export '{export.name}'")
+            (export, source_album_dir, digest) = album
             dest_album_dir = self.user_backupd_albums.joinpath(source_album_dir.name)
-            self.__sync_album(subcommand, source_album_dir, dest_album_dir)
+            fingerprint_file = dest_album_dir.joinpath("fingerprint.txt")
+            fingerprint = f"{export.name}\n{subcommand}\n{digest}\n"
+            if fingerprint_file.exists() and fingerprint_file.read_text() == fingerprint:
+                logging.debug(f"Skipping album '{source_album_dir.name}', unchanged since last sync")
+                skipped += 1
+                continue
 
-    def __sync_album(self, subcommand: str, source_album_dir: Path, dest_album_dir: Path) -> None:
+            print(f"Synchronizing album '{source_album_dir.name}' in export '{export.name}'")
+            if self.__sync_album(subcommand, source_album_dir, dest_album_dir):
+                fingerprint_file.write_text(fingerprint)
+            else:
+                fingerprint_file.unlink(missing_ok=True)
+        if skipped:
+            print(f"Skipped {skipped} album(s) unchanged since last sync")
+
+    def __sync_album(self, subcommand: str, source_album_dir: Path, dest_album_dir: Path) -> bool:
+        # Returns False if any files couldn't be fully processed
         dest_album_dir.mkdir(parents=True, exist_ok=True)
 
-        rsync_flags = ["--archive"]
+        sync_options = { "link": TAKEOUT_LINK }
         if subcommand == "copy":
-            rsync_flags += ["--ignore-existing"]
+            sync_options["ignore_existing"] = True
         elif subcommand == "sync":
-            rsync_flags += ["--update", "--delete"]
+            sync_options.update(update=True, delete=True)
 
         print(f"Synchronizing media files in album '{source_album_dir.name}'...")
-        self.__sync_media(rsync_flags, source_album_dir, dest_album_dir)
+        self.__sync_media(sync_options, source_album_dir, dest_album_dir)
 
         print(f"Synchronizing metadata files in album '{source_album_dir.name}'...")
-        self.__sync_metadata(rsync_flags, source_album_dir, dest_album_dir)
+        self.__sync_metadata(sync_options, source_album_dir, dest_album_dir)
 
         print(f"Writing manifest for album '{source_album_dir.name}'...")
-        self.__write_album_manifest(dest_album_dir)
+        failed_count = self.__write_album_manifest(dest_album_dir)
 
         print(f"Synchronizing files in '{source_album_dir.name}' to library folders...")
         self.__sync_to_library(subcommand, dest_album_dir)
+        return failed_count == 0
 
-    def __sync_media(self, rsync_flags: list[str], source_album_dir: Path, dest_album_dir: Path) -> None:
+    @timed("sync media")
+    def __sync_media(self, sync_options: dict, source_album_dir: Path, dest_album_dir: Path) -> None:
         # Include all files *with an extension* except .txt and .json
-        rsync(*rsync_flags, "-v",
-              "--exclude", "*.txt", "--exclude", "*.json", "--include", "*.*", "--exclude", "*",
-              f"{source_album_dir}/", f"{dest_album_dir}/")
+        def is_media_file_name(name: str) -> bool:
+            return "." in name and not name.endswith((".txt", ".json"))
 
-    def __sync_metadata(self, rsync_flags: list[str], source_album_dir: Path, dest_album_dir: Path) -> None:
+        result = sync_tree(source_album_dir, dest_album_dir, include=is_media_file_name, **sync_options)
+        result.log_changes()
+        print(f"Synchronized media files: {result.summary()}")
+
+    @timed("sync metadata")
+    def __sync_metadata(self, sync_options: dict, source_album_dir: Path, dest_album_dir: Path) -> None:
         # Google Takeout exports a ".supplemental-metadata.json" sidecar file for each
         # media file. These are awkward to handle for two reasons:
         #
@@ -163,8 +247,8 @@ OAuth2 authentication:
         # We rename all sidecar files to "<media_file>.meta.json" in the destination,
         # which avoids the truncation problem entirely.
         #
-        # To do the rename efficiently we hard-link the renamed files into a temp dir
-        # and rsync from there, rather than building a custom transfer loop.
+        # The renamed files are synced with sync_files(), which takes the
+        # destination name for each source file.
         SUPPL_META_SUFFIX = ".supplemental-metadata"
 
         def get_meta_dest_name(
@@ -256,23 +340,25 @@ OAuth2 authentication:
 
             return None
 
-        with tempfile.TemporaryDirectory(dir=backup_tmpd()) as tmp_dir_path:
-            tmp_dir = Path(tmp_dir_path)
-
-            json_files = [f for f in list_files(source_album_dir) if f.suffix.lower() == ".json"]
-            media_files = [f for f in list_files(source_album_dir) if f.suffix.lower() != ".json"]
-            media_names_lc = {f.name.lower(): f.name for f in media_files}  # for exact filename lookup
-            media_stems_lc = {f.stem.lower(): f.name for f in media_files}  # for stem-only lookup
+        source_files = list_files(source_album_dir)
+        json_files = [f for f in source_files if f.suffix.lower() == ".json"]
+        media_files = [f for f in source_files if f.suffix.lower() != ".json"]
+        media_names_lc = {f.name.lower(): f.name for f in media_files}  # for exact filename lookup
+        media_stems_lc = {f.stem.lower(): f.name for f in media_files}  # for stem-only lookup
 
-            for json_file in json_files:
-                dest_name = get_meta_dest_name(json_file, media_names_lc, media_stems_lc)
-                if dest_name is None:
-                    continue
-                os.link(json_file, tmp_dir.joinpath(dest_name))
+        meta_files = {}  # destination filename → source JSON file
+        for json_file in json_files:
+            dest_name = get_meta_dest_name(json_file, media_names_lc, media_stems_lc)
+            if dest_name is None:
+                continue
+            meta_files[dest_name] = json_file
 
-            rsync(*rsync_flags, "-v", "--include", "*.json", "--exclude", "*", f"{tmp_dir}/", f"{dest_album_dir}/")
+        result = sync_files(meta_files, dest_album_dir, include=lambda name: name.endswith(".json"), **sync_options)
+        result.log_changes()
+        print(f"Synchronized metadata files: {result.summary()}")
 
-    def __write_album_manifest(self, dest_album_dir: Path) -> None:
+    @timed("write manifests")
+    def __write_album_manifest(self, dest_album_dir: Path) -> int:
         # The manifest maps each media file to its year/month, one line per file:
         #   2026/01/photo.jpg
         #   2026/03/video.mp4
@@ -283,10 +369,20 @@ OAuth2 authentication:
         # is slow. To avoid doing it on every run, we load the existing manifest and
         # re-use entries for files that are already present. Only files that are new
         # since the last run need their timestamp extracted.
+        #
+        # Files missing from the manifest are then looked up in the shared timestamp
+        # cache, which covers the same photo appearing in other albums or a renamed album.
+        #
+        # Remaining new files are fanned out across worker processes (CLOUD_BACKUP_MEDIA_JOBS),
+        # and results are gathered back in directory order so the manifest is
+        # deterministic. Files we can't get a timestamp for are reported and left
+        # out of the manifest, so they'll be retried on the next run. Returns the
+        # number of those files.
         manifest_file = dest_album_dir.joinpath("manifest.txt")
         manifest_new = []
         manifest_existing = {}
         manifest_updates = 0
+        new_files = []
 
         # Index the existing manifest by lowercase filename for fast lookup below
         if manifest_file.exists():
@@ -304,16 +400,38 @@ OAuth2 authentication:
                 manifest_new.append(existing_line)
                 continue
 
-            # New file — extract the creation timestamp and add it to the manifest
-            dt = MediaFileInfo(file).get_create_timestamp()
-            manifest_new.append((dt.strftime("%Y"), dt.strftime("%m"), file.name))
+            # Re-use the timestamp if we've seen this file before (e.g. in another album)
+            dt = self.timestamp_cache.get(file)
+            if dt:
+                manifest_new.append((dt.strftime("%Y"), dt.strftime("%m"), file.name))
+                manifest_updates += 1
+                continue
+
+            # New file — placeholder until we've extracted its creation timestamp
+            new_files.append((len(manifest_new), file))
+            manifest_new.append(None)
+
+        # Extract creation timestamps for new files and fill in the placeholders
+        failed_files = []
+        timestamps = get_create_timestamps([file for _, file in new_files], MEDIA_JOBS)
+        for (i, file), (dt, err) in zip(new_files, timestamps):
+            if dt is None:
+                logging.error(f"Failed to get create timestamp for '{file.name}': {err}")
+                failed_files.append(file)
+                continue
+            manifest_new[i] = (dt.strftime("%Y"), dt.strftime("%m"), file.name)
             manifest_updates += 1
+            self.timestamp_cache.put(file, dt)
+        manifest_new = [line for line in manifest_new if line is not None]
 
-        if manifest_updates > 0:
+        if failed_files:
+            print(f"Skipped {len(failed_files)} file(s) with no create timestamp, will retry on next run")
+        if manifest_updates > 0 or not manifest_file.exists():
             self.__write_manifest_file(manifest_file, manifest_new)
             print(f"Wrote updated manifest with {len(manifest_new)} total line(s), {manifest_updates} updates(s)")
         else:
             print(f"Manifest already up to date with {len(manifest_new)} line(s)")
+        return len(failed_files)
 
     def __read_manifest_file(self, manifest_file: Path) -> list[tuple[str, str, str]]:
         # Each line is "YYYY/MM/filename", e.g. "2026/01/photo.jpg"
@@ -331,57 +449,91 @@ OAuth2 authentication:
         return manifest
 
 
+    @timed("link library")
     def __sync_to_library(self, subcommand: str, album_dir: Path) -> None:
         # The library is a flat-ish folder tree organised by year/month:
         #   library/2026/01/photo.jpg
         # Files are hard-linked (not copied) from the album dir to avoid using
         # extra disk space. The manifest tells us which year/month each file belongs to.
-        manifest_file = album_dir.joinpath("manifest.txt")
-        for (year, month, file_name) in self.__read_manifest_file(manifest_file):
-            album_file = album_dir.joinpath(file_name)
-            library_file = self.user_backupd_library.joinpath(year, month, file_name)
-
-            if self.__sync_file_to_library(subcommand, album_file, library_file):
-                print(f"Linked '{year}/{month}/{file_name}'")
+        #
+        # The album folder and each library month folder are scanned once, and
+        # files are compared by the inode numbers that come back from scandir,
+        # so an album that's already fully linked costs one directory read per
+        # folder. Files are only stat'ed when their inodes differ. All link
+        # operations are planned first, then applied in one batch.
+        album_entries = self.__scan_dir_entries(album_dir)
+        library_entries = {}  # (year, month) → { filename: DirEntry }
+        link_ops = []  # (op, album file, library file, label)
+
+        for (year, month, file_name) in self.__read_manifest_file(album_dir.joinpath("manifest.txt")):
+            if (year, month) not in library_entries:
+                library_entries[(year, month)] = self.__scan_dir_entries(self.user_backupd_library.joinpath(year, month))
+            month_entries = library_entries[(year, month)]
 
             # Sync any sidecar metadata files alongside the media file.
             # We check both .json (plain) and .meta.json (renamed supplemental metadata).
-            for ext in [".json", ".meta.json"]:
-                meta_file = album_dir.joinpath(file_name + ext)
-                if meta_file.exists():
-                    library_meta_file = self.user_backupd_library.joinpath(year, month, file_name + ext)
-                    if self.__sync_file_to_library(subcommand, meta_file, library_meta_file):
-                        print(f"Linked '{year}/{month}/{file_name + ext}'")
-
-    def __sync_file_to_library(self, subcommand: str, album_file: Path, library_file: Path) -> bool:
+            for name in [file_name, file_name + ".json", file_name + ".meta.json"]:
+                album_entry = album_entries.get(name)
+                if album_entry is None: continue
+                op = self.__plan_library_link(subcommand, album_entry, month_entries.get(name))
+                if op:
+                    library_file = self.user_backupd_library.joinpath(year, month, name)
+                    link_ops.append((op, Path(album_entry.path), library_file, f"{year}/{month}/{name}"))
+
+        created_dirs = set()
+        for (op, album_file, library_file, label) in link_ops:
+            if op == "link_library":
+                if library_file.parent not in created_dirs:
+                    library_file.parent.mkdir(parents=True, exist_ok=True)
+                    created_dirs.add(library_file.parent)
+                library_file.hardlink_to(album_file)
+            elif op == "link_album":
+                self.__replace_with_hard_link(album_file, library_file)
+            elif op == "replace_library":
+                self.__replace_with_hard_link(library_file, album_file)
+            print(f"Linked '{label}'")
+        span_add(files=len(link_ops))
+        report_count("photos_linked", len(link_ops))
+
+    def __plan_library_link(self, subcommand: str, album_entry: os.DirEntry, library_entry: os.DirEntry | None) -> str | None:
         # Case 1: library file doesn't exist yet — create it as a hard link to the album file
-        if not library_file.exists():
-            library_file.parent.mkdir(parents=True, exist_ok=True)
-            library_file.hardlink_to(album_file)
-            return True
-
-        album_stat = album_file.stat()
-        library_stat = library_file.stat()
+        if library_entry is None:
+            return "link_library"
 
-        # Case 2: already the same inode — files are already hard-linked, nothing to do
+        # Case 2: already the same inode — files are already hard-linked, nothing to do.
+        # Inode numbers from scandir are checked first, since they don't need a stat.
+        if album_entry.inode() == library_entry.inode():
+            return None
+        album_stat = album_entry.stat()
+        library_stat = library_entry.stat()
         is_hard_linked = (album_stat.st_ino == library_stat.st_ino and album_stat.st_dev == library_stat.st_dev)
         if is_hard_linked:
-            return False
+            return None
 
         # Case 3: different inodes but same size — treat as the same photo (e.g. it
         # appears in multiple albums). Replace the album copy with a hard link to the
         # library copy so both point at a single inode and we don't store it twice.
         are_same_size = (album_stat.st_size == library_stat.st_size)
         if are_same_size:
-            album_file.unlink()
-            album_file.hardlink_to(library_file)
-            return True
+            return "link_album"
 
         # Case 4: files differ (e.g. the export contains an updated version of the photo).
         # In sync mode, replace the library file with the newer album file.
         if subcommand == "sync" and (album_stat.st_mtime > library_stat.st_mtime):
-            library_file.unlink()
-            library_file.hardlink_to(album_file)
-            return True
-
-        return False
+            return "replace_library"
+
+        return None
+
+    def __scan_dir_entries(self, dir_path: Path) -> dict[str, os.DirEntry]:
+        try:
+            with os.scandir(dir_path) as entries:
+                return { entry.name: entry for entry in entries if entry.is_file(follow_symlinks=False) }
+        except FileNotFoundError:
+            return {}
+
+    def __replace_with_hard_link(self, file: Path, target_file: Path) -> None:
+        # Links to a temp name and renames over the file, so it's never missing
+        tmp_file = file.with_name(f".{file.name}.partial")
+        tmp_file.unlink(missing_ok=True)
+        tmp_file.hardlink_to(target_file)
+        os.replace(tmp_file, file)
@@ -0,0 +1,425 @@
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+import gzip
+import json
+import logging
+import os
+from pathlib import Path, PurePosixPath
+import shutil
+import stat
+import subprocess
+import tarfile
+import time
+from typing import BinaryIO, Callable, Iterator
+import zipfile
+
+from ..lib import *
+from .sync import try_hard_link
+
+
+ARCHIVE_EXTS = [".tgz", ".zip"]
+COPY_BUFFER_SIZE = 1024 * 1024
+READ_BUFFER_SIZE = 8 * 1024 * 1024
+
+# External gzip decompressors, in order of preference. Much faster than
+# Python's zlib, which inflates on a single thread in the same process.
+# Can be overridden with CLOUD_BACKUP_GZIP_TOOL, or set to "python" to
+# always use the built-in decompressor.
+GZIP_TOOLS = ["igzip", "pigz"]
+GZIP_TOOL = os.environ.get("CLOUD_BACKUP_GZIP_TOOL")
+
+
+@dataclass
+class ArchiveMember:
+    name: str
+    size: int
+    mtime: float
+    mode: int
+    is_dir: bool
+
+    def parts(self) -> tuple[str, ...]:
+        return PurePosixPath(self.name).parts
+
+    def is_under(self, folder: str) -> bool:
+        return self.name.startswith(folder.rstrip("/") + "/")
+
+
+@dataclass
+class ArchiveExtractResult:
+    members: list[ArchiveMember] = field(default_factory=list)
+    bytes_written: int = 0
+    bytes_linked: int = 0
+    members_skipped: int = 0
+    members_unchanged: int = 0
+    seconds: float = 0.0
+
+
+def iter_archive(
+    archive: Path, include: Callable[[ArchiveMember], bool] | None = None
+) -> Iterator[tuple[ArchiveMember, BinaryIO | None]]:
+    # Yields each regular file and directory in the archive, in archive order,
+    # along with a file object for reading a file's contents. The file object
+    # is only valid until the next member is requested, which lets .tgz files
+    # be read as a single forward-only stream. Members that don't match
+    # 'include' are still yielded, but without a file object, and their
+    # contents are skipped over (zip members aren't read at all).
+    if archive.name.lower().endswith(".tgz"):
+        yield from __iter_tar(archive, include)
+    elif archive.name.lower().endswith(".zip"):
+        yield from __iter_zip(archive, include)
+    else:
+        raise ValueError(f"Unsupported archive type: {archive.name}")
+
+def __iter_tar(archive: Path, include: Callable[[ArchiveMember], bool] | None) -> Iterator[tuple[ArchiveMember, BinaryIO | None]]:
+    with open_tgz_stream(archive) as tar:
+        for info in tar:
+            if not (info.isfile() or info.isdir()): continue
+            member = ArchiveMember(
+                __safe_member_name(info.name), info.size, info.mtime, info.mode, info.isdir())
+            is_included = info.isfile() and (include is None or include(member))
+            yield (member, tar.extractfile(info) if is_included else None)
+
+def __iter_zip(archive: Path, include: Callable[[ArchiveMember], bool] | None) -> Iterator[tuple[ArchiveMember, BinaryIO | None]]:
+    with zipfile.ZipFile(archive, "r") as zip_file:
+        for info in zip_file.infolist():
+            member = __zip_member(info)
+            if member.is_dir or not (include is None or include(member)):
+                yield (member, None)
+            else:
+                with zip_file.open(info) as f:
+                    yield (member, f)
+
+def __zip_member(info: zipfile.ZipInfo) -> ArchiveMember:
+    mtime = time.mktime(info.date_time + (0, 0, -1))
+    mode = (info.external_attr >> 16) & 0o7777 or (0o755 if info.is_dir() else 0o644)
+    return ArchiveMember(__safe_member_name(info.filename), info.file_size, mtime, mode, info.is_dir())
+
+def scan_archive(archive: Path) -> list[ArchiveMember]:
+    # Lists an archive's members without extracting anything. Zip files are
+    # listed from their central directory. .tgz files have no index, so the
+    # stream is still decompressed, but member contents are skipped over.
+    if archive.name.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive, "r") as zip_file:
+            return [__zip_member(info) for info in zip_file.infolist()]
+    return [member for member, _ in iter_archive(archive)]
+
+@contextmanager
+def open_tgz_stream(archive: Path, gzip_tool: str | None = None) -> Iterator[tarfile.TarFile]:
+    # Opens a .tgz as a forward-only tar stream, decompressing through an
+    # external tool when one is available, otherwise with a large read buffer.
+    # gzip_tool can name a specific tool, or "python" for the built-in one.
+    if gzip_tool is None:
+        gzip_tool = gzip_tool_path()
+    if gzip_tool in (None, "python"):
+        with open(archive, "rb", buffering=READ_BUFFER_SIZE) as raw:
+            with gzip.GzipFile(fileobj=raw, mode="rb") as gz:
+                with tarfile.open(fileobj=gz, mode="r|", bufsize=COPY_BUFFER_SIZE) as tar:
+                    yield tar
+        return
+
+    cmd = [gzip_tool, "-dc", str(archive)]
+    log_command(cmd)
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=READ_BUFFER_SIZE)
+    completed = False
+    try:
+        with tarfile.open(fileobj=process.stdout, mode="r|", bufsize=COPY_BUFFER_SIZE) as tar:
+            yield tar
+        # Drain any trailing padding so the tool can exit cleanly
+        while process.stdout.read(COPY_BUFFER_SIZE): pass
+        completed = True
+    finally:
+        if not completed:
+            process.kill()
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+def gzip_tool_path() -> str | None:
+    if GZIP_TOOL:
+        return None if GZIP_TOOL == "python" else shutil.which(GZIP_TOOL)
+    return next((path for path in map(shutil.which, GZIP_TOOLS) if path), None)
+
+def __safe_member_name(name: str) -> str:
+    path = PurePosixPath(name)
+    if path.is_absolute() or ".." in path.parts:
+        raise ValueError(f"Unsafe path in archive: {name}")
+    return str(path)
+
+
+def extract_archive(
+    archive: Path, extract_dir: Path, dedup_dir: Path | None = None, dedup_root: str = "",
+    include_folders: list[str] | None = None
+) -> ArchiveExtractResult:
+    # Extracts all members into extract_dir. Safe to run concurrently with
+    # other archives extracting into the same directory, as long as they
+    # hold different files.
+    #
+    # If include_folders is given, only members under those folders in the
+    # archive are extracted (see is_member_in_folders). All members are still
+    # listed in the result.
+    #
+    # Members already in extract_dir with the same size and (whole-second)
+    # mtime, e.g. from a previous version of a changed archive, are left as
+    # they are. Their contents are skipped over rather than read.
+    #
+    # If dedup_dir is given, it's an existing folder holding the same files as
+    # the dedup_root folder in the archive (e.g. a backup of a previous export).
+    # Members that are identical to the file at the same path there are
+    # hard-linked to it rather than written out again.
+    started = time.monotonic()
+    result = ArchiveExtractResult()
+    in_folders = (lambda m: is_member_in_folders(m, include_folders)) if include_folders is not None else None
+    unchanged = set()
+
+    def include(member: ArchiveMember) -> bool:
+        if in_folders and not in_folders(member):
+            return False
+        if __is_extracted_member(member, extract_dir.joinpath(member.name)):
+            unchanged.add(member.name)
+            return False
+        return True
+
+    for member, fileobj in iter_archive(archive, include):
+        result.members.append(member)
+        if in_folders and not in_folders(member):
+            result.members_skipped += 1
+            continue
+        dest_path = extract_dir.joinpath(member.name)
+        if member.is_dir:
+            dest_path.mkdir(parents=True, exist_ok=True)
+            continue
+        if member.name in unchanged:
+            result.members_unchanged += 1
+            continue
+        existing_file = __find_existing_file(member, dedup_dir, dedup_root) if dedup_dir else None
+        if write_archive_member(member, fileobj, dest_path, existing_file):
+            result.bytes_linked += member.size
+        else:
+            result.bytes_written += member.size
+    result.seconds = time.monotonic() - started
+    return result
+
+def is_member_in_folders(member: ArchiveMember, folders: list[str]) -> bool:
+    # Folders are matched case-insensitively, with the member itself being
+    # one of the folders counting as a match
+    name = member.name.lower()
+    return any(name == f.lower().rstrip("/") or name.startswith(f.lower().rstrip("/") + "/") for f in folders)
+
+def __is_extracted_member(member: ArchiveMember, dest_path: Path) -> bool:
+    try:
+        dest_stat = dest_path.lstat()
+    except OSError:
+        return False
+    return (stat.S_ISREG(dest_stat.st_mode) and dest_stat.st_size == member.size
+        and int(dest_stat.st_mtime) == int(member.mtime))
+
+def __find_existing_file(member: ArchiveMember, dedup_dir: Path, dedup_root: str) -> Path | None:
+    # Candidates have to match on size and (whole-second) mtime, and are
+    # then compared on contents as the member is read
+    root_parts = PurePosixPath(dedup_root).parts if dedup_root else ()
+    parts = member.parts()
+    if member.size == 0 or len(parts) <= len(root_parts) or parts[:len(root_parts)] != root_parts:
+        return None
+    existing_file = dedup_dir.joinpath(*parts[len(root_parts):])
+    try:
+        existing_stat = existing_file.lstat()
+    except OSError:
+        return None
+    if (not stat.S_ISREG(existing_stat.st_mode) or existing_stat.st_size != member.size
+            or int(existing_stat.st_mtime) != int(member.mtime)):
+        return None
+    return existing_file
+
+
+def write_archive_member(
+    member: ArchiveMember, fileobj: BinaryIO, dest_file: Path, existing_file: Path | None = None
+) -> bool:
+    # Writes to a temp file alongside the destination and renames it into
+    # place, so an interrupted write never leaves a truncated file behind.
+    # If existing_file is given and has identical contents, dest_file is
+    # hard-linked to it instead, and True is returned.
+    dest_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = dest_file.with_name(f".{dest_file.name}.partial")
+    tmp_file.unlink(missing_ok=True)
+    try:
+        if existing_file is None:
+            with open(tmp_file, "wb") as f:
+                shutil.copyfileobj(fileobj, f, COPY_BUFFER_SIZE)
+        elif __copy_unless_identical(fileobj, existing_file, tmp_file):
+            if try_hard_link(existing_file, tmp_file):
+                os.replace(tmp_file, dest_file)
+                return True
+            shutil.copyfile(existing_file, tmp_file)
+        os.chmod(tmp_file, member.mode & 0o7777)
+        os.utime(tmp_file, (member.mtime, member.mtime))
+        os.replace(tmp_file, dest_file)
+        return False
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
+
+def __copy_unless_identical(fileobj: BinaryIO, existing_file: Path, tmp_file: Path) -> bool:
+    # Compares the member's contents with existing_file as it's read, without
+    # writing anything. Returns True if they're identical. Otherwise, from the
+    # first difference on, writes the member to tmp_file (taking the part
+    # already read from existing_file, since it's the same) and returns False.
+    matched = 0
+    with open(existing_file, "rb") as existing:
+        while True:
+            data = fileobj.read(COPY_BUFFER_SIZE)
+            if not data:
+                if not existing.read(1):
+                    return True
+                break
+            if existing.read(len(data)) != data:
+                break
+            matched += len(data)
+
+        existing.seek(0)
+        with open(tmp_file, "wb") as f:
+            while matched > 0:
+                chunk = existing.read(min(matched, COPY_BUFFER_SIZE))
+                if not chunk:
+                    raise OSError(f"File changed while being read: {existing_file}")
+                f.write(chunk)
+                matched -= len(chunk)
+            f.write(data)
+            shutil.copyfileobj(fileobj, f, COPY_BUFFER_SIZE)
+    return False
+
+def is_archive_member_newer(member: ArchiveMember, dest_file: Path) -> bool:
+    # Same rules as 'rsync --update': skip files that are newer on the
+    # destination, or that match on size and mtime
+    try:
+        stat = dest_file.stat()
+    except FileNotFoundError:
+        return True
+    if stat.st_mtime > member.mtime:
+        return False
+    return int(stat.st_mtime) != int(member.mtime) or stat.st_size != member.size
+
+
+class ArchiveIndex():
+    # Compact on-disk index of the members of a set of archive files (e.g. the
+    # parts of a Takeout export), so their contents can be queried without
+    # extracting them. Stored as gzipped JSON, one [name, size, mtime, mode,
+    # is_dir] row per member, grouped by archive along with the archive's size
+    # and mtime, so an archive only needs to be re-scanned when it changes.
+    VERSION = 1
+    # Members are grouped under each of their folders down to this depth
+    # (e.g. "Takeout/Google Photos/Album"), which covers the folders the
+    # services query. Deeper folders are filtered out of their ancestor's group.
+    FOLDER_DEPTH = 3
+
+    def __init__(self, index_file: Path):
+        self.index_file = index_file
+        self.archives = {}  # archive name → { "size", "mtime", "members" }
+        self.changed = False
+        self.folders = None  # folder → ([(archive name, member)], subdir names), built on first query
+
+        if index_file.exists():
+            try:
+                with gzip.open(index_file, "rt") as f:
+                    data = json.load(f)
+                if data.get("version") == self.VERSION:
+                    self.archives = data["archives"]
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable archive index {index_file}: {e}")
+
+    def is_current(self, archive: Path) -> bool:
+        entry = self.archives.get(archive.name)
+        archive_stat = archive.stat()
+        return (entry is not None
+            and entry["size"] == archive_stat.st_size and entry["mtime"] == archive_stat.st_mtime)
+
+    def put(self, archive: Path, members: list[ArchiveMember]) -> None:
+        archive_stat = archive.stat()
+        self.archives[archive.name] = {
+            "size": archive_stat.st_size,
+            "mtime": archive_stat.st_mtime,
+            "members": [[m.name, m.size, m.mtime, m.mode, m.is_dir] for m in members],
+        }
+        self.changed = True
+        self.folders = None
+
+    def update(self, archives: list[Path], jobs: int) -> list[str]:
+        # Drops archives that no longer exist and scans any that are new or
+        # changed, up to 'jobs' at a time. Returns the names of archives
+        # that failed to scan, which are left out of the index.
+        names = set(archive.name for archive in archives)
+        for name in [name for name in self.archives if name not in names]:
+            del self.archives[name]
+            self.changed = True
+            self.folders = None
+
+        pending = [archive for archive in archives if not self.is_current(archive)]
+        if not pending:
+            return []
+        failed = []
+        with ProcessPoolExecutor(max_workers=max(1, min(jobs, len(pending)))) as executor:
+            futures = { executor.submit(scan_archive, archive.resolve()): archive for archive in pending }
+            for future in as_completed(futures):
+                archive = futures[future]
+                try:
+                    self.put(archive, future.result())
+                except Exception as e:
+                    logging.error(f"Failed to scan {archive.name}: {e}")
+                    failed.append(archive.name)
+        return failed
+
+    def archive_members(self, archive_name: str) -> list[ArchiveMember]:
+        entry = self.archives.get(archive_name)
+        return [ArchiveMember(*row) for row in entry["members"]] if entry else []
+
+    def members(self, folder: str = "") -> Iterator[tuple[str, ArchiveMember]]:
+        # Yields (archive name, member) for each member, optionally
+        # limited to those under a folder in the archive
+        parts = PurePosixPath(folder).parts
+        (members, _) = self.__folders().get("/".join(parts[:self.FOLDER_DEPTH]), ([], set()))
+        if len(parts) <= self.FOLDER_DEPTH:
+            yield from members
+        else:
+            yield from ((name, member) for name, member in members if member.is_under(folder))
+
+    def subdirs(self, folder: str) -> list[str]:
+        # Names of the folders directly under a folder in the archive. Worked
+        # out from member paths, since archives don't always hold entries
+        # for the folders themselves.
+        parts = PurePosixPath(folder).parts
+        if len(parts) < self.FOLDER_DEPTH:
+            return sorted(self.__folders().get("/".join(parts), ([], set()))[1])
+        depth = len(parts)
+        names = set()
+        for _, member in self.members(folder):
+            member_parts = member.parts()
+            if len(member_parts) > depth + 1 or member.is_dir:
+                names.add(member_parts[depth])
+        return sorted(names)
+
+    def __folders(self) -> dict[str, tuple[list[tuple[str, ArchiveMember]], set[str]]]:
+        # Groups every member under each folder it's in (down to FOLDER_DEPTH),
+        # once, rather than going through all of them on each query. ""
+        # holds all members.
+        if self.folders is None:
+            self.folders = {}
+            for archive_name, entry in sorted(self.archives.items()):
+                for row in entry["members"]:
+                    member = ArchiveMember(*row)
+                    parts = member.parts()
+                    for depth in range(min(len(parts) - 1, self.FOLDER_DEPTH) + 1):
+                        (members, subdirs) = self.folders.setdefault("/".join(parts[:depth]), ([], set()))
+                        members.append((archive_name, member))
+                        if depth < len(parts) - 1 or member.is_dir:
+                            subdirs.add(parts[depth])
+        return self.folders
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+        tmp_file = self.index_file.with_name(self.index_file.name + ".tmp")
+        with gzip.open(tmp_file, "wt") as f:
+            json.dump({ "version": self.VERSION, "archives": self.archives }, f, separators=(",", ":"))
+        os.replace(tmp_file, self.index_file)
+        self.changed = False
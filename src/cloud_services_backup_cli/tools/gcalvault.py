@@ -1,4 +1,3 @@
-import subprocess
 from subprocess import CompletedProcess
 import shutil
 from pathlib import Path
@@ -15,9 +14,8 @@ def __gcalvault_run(opts : dict, args : list[str], **kwargs) -> CompletedProcess
 
     if shutil.which("gcalvault") is not None:
         cmd = ['gcalvault', *shell.stringify_args(args)]
-        log_command(cmd)
-        return subprocess.run(
-            cmd,
+        return run_command(
+            f"gcalvault {args[0]}", cmd,
             env=shell.env(
                 GCALVAULT_CONF_DIR=str(user_confd),
                 GCALVAULT_OUTPUT_DIR=str(user_backupd),
@@ -35,5 +33,4 @@ def __gcalvault_run(opts : dict, args : list[str], **kwargs) -> CompletedProcess
         "rtomac/gcalvault",
         *shell.stringify_args(args)
     ]
-    log_command(cmd)
-    return subprocess.run(cmd, **kwargs)
+    return run_command(f"gcalvault {args[0]}", cmd, **kwargs)
@@ -1,4 +1,3 @@
-import subprocess
 from subprocess import CompletedProcess
 import shutil
 from pathlib import Path
@@ -16,9 +15,8 @@ def __gcardvault_run(opts : dict, args: list[str], **kwargs) -> CompletedProcess
 
     if shutil.which("gcardvault") is not None:
         cmd = ['gcardvault', *shell.stringify_args(args)]
-        log_command(cmd)
-        return subprocess.run(
-            cmd,
+        return run_command(
+            f"gcardvault {args[0]}", cmd,
             env=shell.env(
                 GCARDVAULT_CONF_DIR=str(user_confd),
                 GCARDVAULT_OUTPUT_DIR=str(user_backupd),
@@ -36,5 +34,4 @@ def __gcardvault_run(opts : dict, args: list[str], **kwargs) -> CompletedProcess
         "rtomac/gcardvault",
         *shell.stringify_args(args)
     ]
-    log_command(cmd)
-    return subprocess.run(cmd, **kwargs)
+    return run_command(f"gcardvault {args[0]}", cmd, **kwargs)
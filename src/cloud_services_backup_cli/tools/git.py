@@ -1,6 +1,12 @@
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import json
+import logging
 import os
 import subprocess
+import textwrap
+import threading
 from subprocess import CompletedProcess
 from pathlib import Path
 
@@ -19,31 +25,121 @@ def git_has_credentials(access_token_file, credentials_file):
     return access_token_file.exists() and credentials_file.exists()
 
 
-def git_mirror_repo(repo_url: str, backup_dir: Path, credentials_file: Path) -> None:
-    repo_name = os.path.basename(repo_url.rstrip('/')).replace('.git', '')
+GIT_JOBS = env_int("CLOUD_BACKUP_GIT_JOBS", 4)
+
+
+@dataclass
+class GitRepo:
+    url: str
+    # Last push timestamp reported by the host's API, if available
+    pushed_at: str | None = None
+
+
+@dataclass
+class GitMirrorResult:
+    repo_name: str
+    status: str  # "created", "updated", "unchanged", "skipped" or "failed"
+    output: str = ""
+
+
+def git_repo_name(repo_url: str) -> str:
+    return os.path.basename(repo_url.rstrip('/')).replace('.git', '')
+
+def git_mirror_repo(
+    repo: GitRepo, backup_dir: Path, credentials_file: Path, last_pushed_at: str | None = None
+) -> GitMirrorResult:
+    # Output is captured rather than streamed, so that mirrors
+    # running concurrently don't interleave in the log
+    repo_url = repo.url
+    repo_name = git_repo_name(repo_url)
     repo_dir = backup_dir.joinpath(repo_name)
+
+    # Nothing pushed since the last successful mirror, no need to hit the remote
+    if repo.pushed_at and repo.pushed_at == last_pushed_at and os.path.isdir(repo_dir):
+        return GitMirrorResult(repo_name, "skipped")
+
     if not os.path.isdir(repo_dir):
-        print(f"Creating mirror of {repo_name}...")
-        git("clone", "--mirror", 
-            "--config", f"credential.helper=store --file {credentials_file}", 
+        result = git_capture("clone", "--mirror",
+            "--config", f"credential.helper=store --file {credentials_file}",
             repo_url, repo_dir)
+        status = "created"
     else:
-        print(f"Updating mirror of {repo_name}...")
-        git("--git-dir", repo_dir, "remote", "update")
-
-def git_mirror_repos(repo_urls: list[str], backup_dir: Path, credentials_file: Path) -> None:
-    for repo_url in repo_urls:
-        git_mirror_repo(repo_url, backup_dir, credentials_file)
+        refs_before = git_capture("--git-dir", repo_dir, "for-each-ref").stdout
+        result = git_capture("--git-dir", repo_dir, "remote", "update")
+        refs_after = git_capture("--git-dir", repo_dir, "for-each-ref").stdout
+        status = "updated" if refs_before != refs_after else "unchanged"
+
+    if result.returncode != 0:
+        status = "failed"
+    return GitMirrorResult(repo_name, status, result.stdout)
+
+def git_mirror_repos(
+    repos: list[GitRepo], backup_dir: Path, credentials_file: Path,
+    state_file: Path | None = None, force: bool = False, jobs: int = GIT_JOBS
+) -> None:
+    # The state file records the last push timestamp seen for each repo
+    # that mirrored successfully, so unchanged repos can be skipped next time
+    state = __read_mirror_state(state_file) if state_file and not force else {}
+    print_lock = threading.Lock()
+    results = []
+
+    def mirror(repo: GitRepo) -> None:
+        try:
+            result = git_mirror_repo(repo, backup_dir, credentials_file, state.get(repo.url))
+        except Exception as e:
+            result = GitMirrorResult(git_repo_name(repo.url), "failed", str(e))
+        with print_lock:
+            if result.status in ("unchanged", "skipped"):
+                logging.debug(f"Mirror of {result.repo_name} {result.status}")
+                logging.debug(result.output.rstrip())
+            else:
+                print(f"Mirror of {result.repo_name} {result.status}")
+                if result.output.strip():
+                    print(textwrap.indent(result.output.rstrip(), "  "))
+            if result.status != "failed" and repo.pushed_at:
+                state[repo.url] = repo.pushed_at
+            results.append(result)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        list(executor.map(mirror, repos))
+
+    if state_file:
+        __write_mirror_state(state_file, { r.url: state[r.url] for r in repos if r.url in state })
+
+    counts = { status: 0 for status in ("created", "updated", "unchanged", "skipped", "failed") }
+    for result in results:
+        counts[result.status] += 1
+    span_add(files=counts["created"] + counts["updated"])
+    report_count("repos_mirrored", len(results) - counts["failed"])
+    print(f"Mirrored {len(results)} repo(s): " + ", ".join(f"{n} {status}" for status, n in counts.items()))
+
+    failed = sorted(r.repo_name for r in results if r.status == "failed")
+    if failed:
+        error(f"Failed to mirror {len(failed)} repo(s): {', '.join(failed)}")
+
+def __read_mirror_state(state_file: Path) -> dict[str, str]:
+    if not state_file.exists():
+        return {}
+    with open(state_file, "r") as f:
+        return json.load(f)
+
+def __write_mirror_state(state_file: Path, state: dict[str, str]) -> None:
+    tmp_file = state_file.with_name(state_file.name + ".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, state_file)
 
 
 def git(*args: str) -> CompletedProcess:
     return __git_run(args, check=True)
 
+def git_capture(*args: str) -> CompletedProcess:
+    return __git_run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
 def __git_run(args: list[str], **kwargs) -> CompletedProcess:
     cmd = ["git", *shell.stringify_args(args)]
-    log_command(cmd)
-    return subprocess.run(
-        cmd,
+    return run_command(
+        f"git {args[2] if args[0] == '--git-dir' else args[0]}", cmd,
         env=shell.env(
             # Force git to use credentials we're providing,
             # and not get mixed up with other creds in env
@@ -64,6 +160,8 @@ class GitHostService(Service):
         self.user_backupd = backup_datad(app_slug, user_slug)
         self.access_token_file = self.user_confd.joinpath(".git-access-token")
         self.credentials_file = self.user_confd.joinpath(".git-credentials")
+        self.mirror_state_file = self.user_backupd.joinpath(".mirror-state.json")
+        self.http_cache_dir = self.user_confd.joinpath("http-cache")
 
         self.user_confd.mkdir(parents=True, exist_ok=True)
         self.user_backupd.mkdir(parents=True, exist_ok=True)
@@ -83,16 +181,24 @@ class GitHostService(Service):
 
     def _backup(self, subcommand: str, *args: str) -> None:
         print(f"Retrieving git URLs for all repos owned by {self.username}...")
-        repo_urls = self._get_repo_urls()
+        with span("list repos"):
+            repos = self._get_repos()
 
+        # In 'sync' mode, refresh every repo whether or not the API
+        # reports new pushes since the last backup
         print(f"Backing up all repos...")
-        git_mirror_repos(repo_urls, self.user_backupd, self.credentials_file)
+        with span("mirror repos"):
+            git_mirror_repos(repos, self.user_backupd, self.credentials_file,
+                state_file=self.mirror_state_file, force=(subcommand == "sync"))
 
     def _get_credentials(self) -> tuple[str, str]:
         with open(self.access_token_file, "r") as f:
             access_token = f.read().strip()
         return (self.username, access_token)
 
+    def _http_client(self, headers: dict[str, str] | None = None) -> HttpClient:
+        return HttpClient(self.http_cache_dir, auth=self._get_credentials(), headers=headers)
+
     @abstractmethod
-    def _get_repo_urls(self) -> list[str]:
+    def _get_repos(self) -> list[GitRepo]:
         raise NotImplementedError()
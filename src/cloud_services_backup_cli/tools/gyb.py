@@ -1,5 +1,4 @@
 import os
-import subprocess
 from subprocess import CompletedProcess
 import shutil
 from pathlib import Path
@@ -22,8 +21,7 @@ def __gyb_run(opts: dict, args: list[str], **kwargs) -> CompletedProcess:
             "--local-folder", str(user_backupd),
             *shell.stringify_args(args)
         ]
-        log_command(cmd)
-        return subprocess.run(cmd, **kwargs)
+        return run_command("gyb", cmd, **kwargs)
     
     cmd = [
         "docker", "run",
@@ -41,5 +39,4 @@ def __gyb_run(opts: dict, args: list[str], **kwargs) -> CompletedProcess:
         "awbn/gyb",
         "/app/gyb", *shell.stringify_args(args)
     ]
-    log_command(cmd)
-    return subprocess.run(cmd, **kwargs)
+    return run_command("gyb", cmd, **kwargs)
@@ -1,18 +1,25 @@
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import heapq
 import json
+import mmap
+import multiprocessing.util
+import os
 import subprocess
+import threading
+import time
 from subprocess import CompletedProcess
 from pathlib import Path
 import re
+import struct
 from datetime import datetime
 import dateutil
+import functools
 import logging
 
-from PIL import Image
-from pillow_heif import register_heif_opener
-register_heif_opener()
-import piexif
-from hachoir.parser import createParser
-from hachoir.metadata import extractMetadata
+# Pillow, pillow_heif, piexif and hachoir are slow to import, so they're
+# imported where they're used, the first time media files are read
 
 from ..lib import *
 from . import shell
@@ -27,18 +34,339 @@ VIDEO_EXTS = [ ".mp4", ".mov", ".m4v", ".mkv" ]
 EXIF_CREATE_DATE_TAGS = ["DateTimeOriginal", "CreateDate", "DateTimeDigitized", "DateTime"]
 EXIF_CREATE_DATE_TAGS_PLUS = EXIF_CREATE_DATE_TAGS + ["DateCreated", "TrackCreateDate", "MediaCreateDate", "CreationDate"]
 
+EXIF_IFD_NAMES = ["0th", "Exif", "1st", "GPS", "Interop"]
+
+
+@functools.cache
+def exif_tag_index() -> dict[str, list[tuple[str, int]]]:
+    # Maps tag name -> [(ifd_name, tag_id)], in the order IFDs are searched,
+    # with the first tag id that has that name in each IFD. Built once.
+    import piexif
+    index = {}
+    for ifd_name in EXIF_IFD_NAMES:
+        seen = set()
+        for tag_id, tag in piexif.TAGS[ifd_name].items():
+            if not tag_id or tag["name"] in seen: continue
+            seen.add(tag["name"])
+            index.setdefault(tag["name"], []).append((ifd_name, tag_id))
+    return index
+
 
 def exiftool(*args: str) -> CompletedProcess:
     return __exiftool_run(args, check=True)
 
-def exiftool_pipe(*args: str) -> CompletedProcess:
-    result = __exiftool_run(args, check=True, capture_output=True, text=True)
-    return result.stdout
+def exiftool_pipe(*args: str) -> str:
+    return __exiftool_worker().execute(*shell.stringify_args(args))
+
+def exiftool_close() -> None:
+    global __worker
+    if __worker is not None:
+        __worker.close()
+        __worker = None
 
 def __exiftool_run(args: list[str], **kwargs) -> CompletedProcess:
     cmd = ["exiftool", *shell.stringify_args(args)]
-    log_command(cmd)
-    return subprocess.run(cmd, **kwargs)
+    return run_command("exiftool", cmd, **kwargs)
+
+
+__worker = None
+
+def __exiftool_worker() -> "ExiftoolWorker":
+    global __worker
+    if __worker is None:
+        __worker = ExiftoolWorker()
+        atexit.register(exiftool_close)
+    return __worker
+
+def __forget_exiftool_worker() -> None:
+    # A forked child must not talk to (or shut down) the parent's
+    # exiftool process, it will start its own on first use
+    global __worker
+    __worker = None
+
+os.register_at_fork(after_in_child=__forget_exiftool_worker)
+
+
+def get_create_timestamps(
+    file_paths: list[Path], jobs: int = 1
+) -> list[tuple[datetime | None, str | None]]:
+    # Returns a (timestamp, error) tuple for each file, in the same
+    # order as file_paths regardless of which worker finishes first
+    if jobs <= 1 or len(file_paths) <= 1:
+        return [__get_create_timestamp(f) for f in file_paths]
+
+    jobs = min(jobs, len(file_paths))
+    chunksize = max(1, len(file_paths) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=__init_create_timestamps_worker) as executor:
+        return list(executor.map(__get_create_timestamp, file_paths, chunksize=chunksize))
+
+def __init_create_timestamps_worker() -> None:
+    # Pool workers exit via os._exit, and depending on the Python version
+    # and start method, without running atexit handlers. Multiprocessing
+    # finalizers always run, so the worker's exiftool is stopped from one.
+    multiprocessing.util.Finalize(None, exiftool_close, exitpriority=0)
+
+def __get_create_timestamp(file_path: Path) -> tuple[datetime | None, str | None]:
+    try:
+        return (MediaFileInfo(file_path).get_create_timestamp(), None)
+    except Exception as e:
+        return (None, str(e) or type(e).__name__)
+
+
+def open_image(file_path: str | Path):
+    from PIL import Image
+    __register_heif_opener()
+    return Image.open(file_path)
+
+@functools.cache
+def __register_heif_opener() -> None:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+
+
+def load_exif_from_header(file_path: str | Path) -> dict | None:
+    # Lightweight alternative to Image.open for reading Exif. Maps the file
+    # and walks just the container structures needed to locate the Exif blob:
+    # JPEG marker segments, TIFF IFDs, or HEIF meta/iinf/iloc boxes. Only the
+    # pages that are actually touched get read from disk, which for JPEG and
+    # HEIF is typically the first few KB.
+    #
+    # Returns the piexif dict ({} if the file has no Exif), or None if the
+    # format isn't recognized and the caller should fall back to Pillow.
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if buf[:2] == b"\xff\xd8":
+                exif = __find_jpeg_exif(buf)
+            elif buf[:4] in (b"II*\x00", b"MM\x00*"):
+                # piexif reads the IFDs straight out of the mapped file
+                exif = buf
+            elif buf[4:8] == b"ftyp":
+                exif = __find_heif_exif(buf)
+            else:
+                return None
+
+            if exif is None:
+                return None
+            if not exif:
+                return {}
+            import piexif
+            return piexif.load(exif)
+
+def __find_jpeg_exif(buf: mmap.mmap) -> bytes | None:
+    # Walks marker segments and returns the APP1 Exif payload
+    # ("Exif\0\0" + TIFF data), stopping before any image data
+    pos = 2
+    while pos + 4 <= len(buf):
+        if buf[pos] != 0xFF:
+            return None
+        code = buf[pos + 1]
+        if code == 0xFF:  # Fill byte
+            pos += 1
+            continue
+        if code in (0xD9, 0xDA):  # EOI or SOS, no more metadata segments
+            return b""
+        if code == 0x01 or 0xD0 <= code <= 0xD7:  # Standalone markers
+            pos += 2
+            continue
+        length = struct.unpack_from(">H", buf, pos + 2)[0]
+        if code == 0xE1 and buf[pos + 4:pos + 10] == b"Exif\x00\x00":
+            return buf[pos + 4:pos + 2 + length]
+        pos += 2 + length
+    return None
+
+def __find_heif_exif(buf: mmap.mmap) -> bytes | None:
+    # HEIF stores Exif as an item of type "Exif" in the top-level meta box.
+    # iinf gives us the item id, iloc gives us where its bytes live.
+    meta = next((b for b in __iter_boxes(buf, 0, len(buf)) if b[0] == b"meta"), None)
+    if meta is None:
+        return None
+    (_, meta_start, meta_end) = meta
+    meta_boxes = {t: (s, e) for (t, s, e) in __iter_boxes(buf, meta_start + 4, meta_end)}
+    if b"iinf" not in meta_boxes or b"iloc" not in meta_boxes:
+        return b""
+
+    exif_item_id = __find_heif_item_id(buf, *meta_boxes[b"iinf"], b"Exif")
+    if exif_item_id is None:
+        return b""
+    location = __find_heif_item_location(buf, *meta_boxes[b"iloc"], exif_item_id)
+    if location is None:
+        return None
+
+    (construction_method, extents) = location
+    if construction_method == 0:
+        data_start = 0
+    elif construction_method == 1 and b"idat" in meta_boxes:
+        data_start = meta_boxes[b"idat"][0]
+    else:
+        return None
+    data = b"".join(
+        buf[data_start + offset:(data_start + offset + length) if length else len(buf)]
+            for (offset, length) in extents)
+
+    # Item data is prefixed with a 4-byte offset to the TIFF header
+    if len(data) < 4:
+        return None
+    tiff_start = 4 + struct.unpack_from(">I", data, 0)[0]
+    return b"Exif\x00\x00" + data[tiff_start:]
+
+def __find_heif_item_id(buf: mmap.mmap, start: int, end: int, item_type: bytes) -> int | None:
+    version = buf[start]
+    pos = start + 4 + (2 if version == 0 else 4)
+    for (box_type, box_start, _) in __iter_boxes(buf, pos, end):
+        if box_type != b"infe": continue
+        infe_version = buf[box_start]
+        if infe_version < 2: continue
+        id_size = 2 if infe_version == 2 else 4
+        item_id = __read_uint(buf, box_start + 4, id_size)
+        # Skip item_protection_index (2 bytes)
+        if buf[box_start + 4 + id_size + 2:box_start + 4 + id_size + 6] == item_type:
+            return item_id
+    return None
+
+def __find_heif_item_location(
+    buf: mmap.mmap, start: int, end: int, item_id: int
+) -> tuple[int, list[tuple[int, int]]] | None:
+    version = buf[start]
+    pos = start + 4
+    offset_size = buf[pos] >> 4
+    length_size = buf[pos] & 0x0F
+    base_offset_size = buf[pos + 1] >> 4
+    index_size = buf[pos + 1] & 0x0F if version in (1, 2) else 0
+    pos += 2
+    id_size = 2 if version < 2 else 4
+    item_count = __read_uint(buf, pos, id_size)
+    pos += id_size
+
+    for _ in range(item_count):
+        if pos >= end:
+            return None
+        current_id = __read_uint(buf, pos, id_size)
+        pos += id_size
+        construction_method = 0
+        if version in (1, 2):
+            construction_method = __read_uint(buf, pos, 2) & 0x0F
+            pos += 2
+        pos += 2  # data_reference_index
+        base_offset = __read_uint(buf, pos, base_offset_size)
+        pos += base_offset_size
+        extent_count = __read_uint(buf, pos, 2)
+        pos += 2
+        extents = []
+        for _ in range(extent_count):
+            pos += index_size
+            extent_offset = __read_uint(buf, pos, offset_size)
+            pos += offset_size
+            extent_length = __read_uint(buf, pos, length_size)
+            pos += length_size
+            extents.append((base_offset + extent_offset, extent_length))
+        if pos > end:  # Truncated, the item ran into whatever follows iloc
+            return None
+        if current_id == item_id:
+            return (construction_method, extents)
+    return None
+
+def __iter_boxes(buf: mmap.mmap, start: int, end: int):
+    # Yields (type, content_start, box_end) for ISO BMFF boxes in [start, end)
+    pos = start
+    while pos + 8 <= end:
+        (size, box_type) = struct.unpack_from(">I4s", buf, pos)
+        header_size = 8
+        if size == 1:
+            if pos + 16 > end: return
+            size = struct.unpack_from(">Q", buf, pos + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_size or pos + size > end: return
+        yield (box_type, pos + header_size, pos + size)
+        pos += size
+
+def __read_uint(buf: mmap.mmap, pos: int, size: int) -> int:
+    if size == 0:
+        return 0
+    return int.from_bytes(buf[pos:pos + size], "big")
+
+
+class ExiftoolWorker():
+    # Long-lived exiftool process in "-stay_open" mode. Arguments for
+    # each request are written to stdin one per line, followed by
+    # "-execute<n>", and exiftool responds on stdout with the output
+    # for that request terminated by a "{ready<n>}" line. This avoids
+    # paying Perl interpreter startup for every file we look up.
+    def __init__(self):
+        self.process = None
+        self.request_id = 0
+        self.lock = threading.Lock()
+
+    def execute(self, *args: str) -> str:
+        with self.lock:
+            try:
+                return self.__execute(args)
+            except (BrokenPipeError, EOFError):
+                # Worker died (crashed or was killed), restart it
+                # and retry the request once
+                logging.debug("exiftool worker exited unexpectedly, restarting")
+                self.__stop()
+                return self.__execute(args)
+
+    def close(self) -> None:
+        with self.lock:
+            self.__stop()
+
+    def __execute(self, args: list[str]) -> str:
+        if self.process is None or self.process.poll() is not None:
+            self.__start()
+
+        self.request_id += 1
+        ready_marker = f"{{ready{self.request_id}}}"
+        logging.debug(f'Sending to exiftool worker: "{'" "'.join(args)}"')
+        for arg in args:
+            self.process.stdin.write(f"{arg}\n")
+        self.process.stdin.write(f"-execute{self.request_id}\n")
+        self.process.stdin.flush()
+
+        output = []
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise EOFError("exiftool worker closed its output stream")
+            if line.rstrip("\r\n") == ready_marker:
+                break
+            output.append(line)
+        return "".join(output)
+
+    def __start(self) -> None:
+        self.__stop()
+        cmd = ["exiftool", "-stay_open", "True", "-@", "-"]
+        log_command(cmd)
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8")
+
+    def __stop(self) -> None:
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            if process.poll() is None:
+                process.stdin.write("-stay_open\nFalse\n")
+                process.stdin.flush()
+                process.wait(timeout=10)
+        except (BrokenPipeError, OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+        finally:
+            for stream in (process.stdin, process.stdout):
+                try:
+                    stream.close()
+                except OSError:
+                    pass
 
 
 class MediaFileInfo():
@@ -91,26 +419,49 @@ class MediaFileInfo():
         raise ValueError(f"No create timestamp found for file {self.file_path}")
 
 
-    # Parse exif tags from images using Pillow
+    # Parse exif tags from images using piexif
     def __read_exif_tag(self, *tag_names) -> str | None:
-        with Image.open(self.file_path) as img:
-            exif_bytes = img.info.get("exif", b"")
-            if not exif_bytes:
-                return None
-            exif_dict = piexif.load(exif_bytes)
-            for tag_name in tag_names:
-                for ifd_name in ["0th", "Exif", "1st", "GPS", "Interop"]:
-                    ifd = exif_dict.get(ifd_name, {})
-                    tag_id = next((k for k, v in piexif.TAGS[ifd_name].items() if v["name"] == tag_name), None)
-                    if tag_id and tag_id in ifd:
-                        value = ifd[tag_id]
-                        if isinstance(value, bytes):
-                            value = value.decode()
-                        return str(value)
+        exif_dict = self.__read_exif_dict()
+        if not exif_dict:
+            return None
+        for tag_name in tag_names:
+            for ifd_name, tag_id in exif_tag_index().get(tag_name, []):
+                ifd = exif_dict.get(ifd_name, {})
+                if tag_id in ifd:
+                    value = ifd[tag_id]
+                    if isinstance(value, bytes):
+                        value = value.decode()
+                    return str(value)
         return None
 
+    # Read exif straight from the file header where we can,
+    # falling back to Pillow for anything else
+    def __read_exif_dict(self) -> dict | None:
+        try:
+            exif_dict = load_exif_from_header(self.file_path)
+        except (struct.error, ValueError, IndexError) as e:
+            logging.debug(f"Header exif reader failed, falling back to Pillow: {e}")
+            exif_dict = None
+        if exif_dict is not None:
+            return exif_dict
+
+        # If Pillow can't read it either, the timestamp is looked for
+        # elsewhere, ending with exiftool
+        import piexif
+        try:
+            with open_image(self.file_path) as img:
+                exif_bytes = img.info.get("exif", b"")
+                if not exif_bytes:
+                    return None
+                return piexif.load(exif_bytes)
+        except Exception as e:
+            logging.debug(f"Pillow couldn't read exif, skipping: {e}")
+            return None
+
     # Parse video metadata fields using Hachoir
     def __read_video_metadata_field(self, *field_names) -> str | int | datetime | None:
+        from hachoir.parser import createParser
+        from hachoir.metadata import extractMetadata
         parser = createParser(str(self.file_path))
         if parser:
             metadata = extractMetadata(parser)
@@ -155,6 +506,9 @@ class MediaFileInfo():
     def __read_exif_tag_w_exiftool(self, *tag_names) -> str | None:
         tag_flags = [f"-{tag}" for tag in tag_names]
         output = exiftool_pipe(*tag_flags, "-json", "-fast2", "--b", str(self.file_path))
+        if not output.strip():
+            # exiftool couldn't read the file (errors go to stderr)
+            return None
         tags = json.loads(output)[0]
         for field in tag_names:
             if field in tags:
@@ -164,3 +518,138 @@ class MediaFileInfo():
     def __parse_exif_date_str(self, date_str: str) -> datetime:
         date_str = re.sub(r'^(\d{4}):(\d{2}):(\d{2})(?=\s|T|$)', r'\1-\2-\3', date_str)
         return dateutil.parser.parse(date_str)
+
+
+class MediaTimestampCache():
+    # Persistent cache of create timestamps, shared across albums and runs.
+    # Entries are keyed by the file's device, inode, size and mtime, so renamed
+    # albums and hard-linked copies of the same photo hit the cache. When hashing is
+    # enabled, entries also record a content hash, which lets separate copies
+    # of the same photo (different inodes) share a single entry.
+    #
+    # The cache is bounded; when it grows past max_entries, the least recently
+    # used entries are evicted, preferring those whose file/inode no longer
+    # exists among the EVICT_PROBE_FACTOR times as many least recently used
+    # entries as need evicting, so a save doesn't stat every entry.
+    VERSION = 2
+    EVICT_PROBE_FACTOR = 4
+
+    def __init__(self, cache_file: Path, max_entries: int = 250000, use_hash: bool = False):
+        self.cache_file = Path(cache_file)
+        self.max_entries = max_entries
+        self.use_hash = use_hash
+        self.entries = {}
+        self.hash_index = {}
+        self.miss_hashes = {}  # key → hash of files get() missed, for put() to reuse
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self.__load()
+
+    def get(self, file_path: Path) -> datetime | None:
+        stat = file_path.stat()
+        key = self.__key(stat)
+        entry = self.entries.get(key)
+
+        if entry is None and self.use_hash:
+            file_hash = self.__hash(file_path)
+            hash_entry = self.entries.get(self.hash_index.get(file_hash))
+            if hash_entry is not None:
+                entry = self.__new_entry(file_path, hash_entry["timestamp"], file_hash)
+                self.__set(key, entry)
+            else:
+                self.miss_hashes[key] = file_hash
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        entry["used"] = int(time.time())
+        entry["path"] = str(file_path)
+        self.dirty = True
+        return datetime.fromisoformat(entry["timestamp"])
+
+    def put(self, file_path: Path, timestamp: datetime) -> None:
+        # A file that just missed in get() has already been hashed, and its
+        # key only matches if it hasn't changed since
+        key = self.__key(file_path.stat())
+        file_hash = None
+        if self.use_hash:
+            file_hash = self.miss_hashes.pop(key, None) or self.__hash(file_path)
+        self.__set(key, self.__new_entry(file_path, timestamp.isoformat(), file_hash))
+
+    def save(self) -> None:
+        # Hashes of misses are only reused by a put() in the same run
+        self.miss_hashes.clear()
+        if not self.dirty:
+            return
+        self.__evict()
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_file.with_name(self.cache_file.name + ".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump({"version": self.VERSION, "entries": self.entries}, f)
+        os.replace(tmp_file, self.cache_file)
+        self.dirty = False
+
+    def stats(self) -> str:
+        return f"{self.hits} hit(s), {self.misses} miss(es), {len(self.entries)} entries"
+
+    def __load(self) -> None:
+        if not self.cache_file.exists():
+            return
+        try:
+            with open(self.cache_file, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable timestamp cache {self.cache_file}: {e}")
+            return
+        if data.get("version") != self.VERSION:
+            return
+        self.entries = data.get("entries", {})
+        for key, entry in self.entries.items():
+            if entry.get("hash"):
+                self.hash_index[entry["hash"]] = key
+
+    def __set(self, key: str, entry: dict) -> None:
+        self.entries[key] = entry
+        if entry.get("hash"):
+            self.hash_index[entry["hash"]] = key
+        self.dirty = True
+
+    def __evict(self) -> None:
+        excess = len(self.entries) - self.max_entries
+        if excess <= 0:
+            return
+
+        lru_keys = heapq.nsmallest(excess * self.EVICT_PROBE_FACTOR, self.entries, key=lambda k: self.entries[k]["used"])
+        evict_keys = [k for k in lru_keys if not self.__inode_exists(k)][:excess]
+        if len(evict_keys) < excess:
+            evict_keys_set = set(evict_keys)
+            evict_keys += [k for k in lru_keys if k not in evict_keys_set][:excess - len(evict_keys)]
+
+        for key in evict_keys:
+            entry = self.entries.pop(key)
+            if entry.get("hash") and self.hash_index.get(entry["hash"]) == key:
+                del self.hash_index[entry["hash"]]
+        logging.debug(f"Evicted {len(evict_keys)} entries from timestamp cache")
+
+    def __inode_exists(self, key: str) -> bool:
+        try:
+            stat = os.stat(self.entries[key]["path"])
+        except OSError:
+            return False
+        return self.__key(stat) == key
+
+    def __new_entry(self, file_path: Path, timestamp: str, file_hash: str | None) -> dict:
+        entry = {"timestamp": timestamp, "path": str(file_path), "used": int(time.time())}
+        if file_hash:
+            entry["hash"] = file_hash
+        return entry
+
+    def __key(self, stat: os.stat_result) -> str:
+        return f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def __hash(self, file_path: Path) -> str:
+        with open(file_path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
@@ -1,9 +1,20 @@
 from abc import abstractmethod
+import atexit
+import base64
+from dataclasses import dataclass
+from datetime import timedelta
+import json
+import logging
 import os
+import secrets
+import socket
 import subprocess
 from subprocess import CompletedProcess
 import shutil
+import sys
+import time
 from pathlib import Path
+from typing import Callable
 
 from ..lib import *
 from . import shell
@@ -12,6 +23,80 @@ RCLONE_CONFIG = os.environ.get(
     "RCLONE_CONFIG",
     str(backup_confd().joinpath("rclone", "rclone.conf")))
 RCLONE_CONFD = os.path.dirname(RCLONE_CONFIG)
+RCLONE_STATS_INTERVAL = os.environ.get("CLOUD_BACKUP_RCLONE_STATS", "5s")
+# How often progress is printed when not on a terminal (e.g. under cron),
+# where it can't be redrawn in place
+RCLONE_PROGRESS_LOG_SECS = 60
+RCLONE_RCD = env_bool("CLOUD_BACKUP_RCLONE_RCD")
+RCLONE_RCD_START_SECS = 120  # Allows for the image being pulled when run in Docker
+RCLONE_RC_POLL_SECS = 1
+RCLONE_RC_TIMEOUT_SECS = 60
+# Command line flags that have a translation to rc params (see __rc_transfer_request)
+RCLONE_RC_FILTER_FLAGS = {
+    "--include": ("IncludeRule", True),
+    "--exclude": ("ExcludeRule", True),
+    "--min-age": ("MinAge", False),
+    "--max-age": ("MaxAge", False),
+}
+RCLONE_RC_CONFIG_FLAGS = {
+    "--ignore-existing": "IgnoreExisting",
+}
+RCLONE_LOG_LEVELS = {
+    "critical": logging.CRITICAL,
+    "error": logging.ERROR,
+    "warning": logging.WARNING,
+    "notice": logging.INFO,
+    "info": logging.INFO,
+    "debug": logging.DEBUG,
+}
+
+
+@dataclass
+class RcloneStats:
+    # Transfer stats, as reported in rclone's JSON log ("stats" object)
+    bytes: int = 0
+    total_bytes: int = 0
+    transfers: int = 0
+    total_transfers: int = 0
+    checks: int = 0
+    total_checks: int = 0
+    deletes: int = 0
+    errors: int = 0
+    speed: float = 0.0  # bytes/s
+    eta: int | None = None  # seconds
+    elapsed_seconds: float = 0.0
+
+    @staticmethod
+    def from_json(stats: dict) -> "RcloneStats":
+        return RcloneStats(
+            bytes=stats.get("bytes", 0),
+            total_bytes=stats.get("totalBytes", 0),
+            transfers=stats.get("transfers", 0),
+            total_transfers=stats.get("totalTransfers", 0),
+            checks=stats.get("checks", 0),
+            total_checks=stats.get("totalChecks", 0),
+            deletes=stats.get("deletes", 0),
+            errors=stats.get("errors", 0),
+            speed=stats.get("speed", 0.0) or 0.0,
+            eta=stats.get("eta"),
+            elapsed_seconds=stats.get("elapsedTime", 0.0) or 0.0,
+        )
+
+    def checks_per_second(self) -> float:
+        return self.checks / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def progress(self) -> str:
+        eta = str(timedelta(seconds=int(self.eta))) if self.eta is not None else "-"
+        return (f"{self.bytes / (1024 * 1024):.1f} / {self.total_bytes / (1024 * 1024):.1f} MB"
+            + f", {self.speed / (1024 * 1024):.1f} MB/s, ETA {eta}"
+            + f", {self.transfers}/{self.total_transfers} transferred"
+            + f", {self.checks}/{self.total_checks} checked ({self.checks_per_second():.0f}/s)"
+            + f", {self.errors} error(s)")
+
+    def summary(self) -> str:
+        return (f"{self.transfers} file(s) transferred ({self.bytes / (1024 * 1024):.1f} MB)"
+            + f", {self.checks} checked, {self.deletes} deleted, {self.errors} error(s)"
+            + f" in {self.elapsed_seconds:.1f}s")
 
 
 def rclone_config() -> Path:
@@ -22,6 +107,9 @@ def rclone_remote_name(app_slug: str, user_slug: str) -> str:
 
 
 def rclone_has_remote(remote: str) -> bool:
+    daemon = rclone_daemon()
+    if daemon:
+        return remote in daemon.call("config/listremotes").get("remotes", [])
     remotes = rclone_pipe("listremotes").splitlines()
     return f"{remote}:" in remotes
 
@@ -46,21 +134,196 @@ def rclone_pipe(*args: str) -> str:
     result = __rclone_run(args, check=True, capture_output=True, text=True)
     return result.stdout
 
+def rclone_transfer(*args: str, progress: Callable[[RcloneStats], None] | None = None) -> RcloneStats:
+    # Runs an rclone command that transfers or deletes files (sync, copy, delete),
+    # passing stats to progress() as they're reported (a progress line by default).
+    # Returns the final stats, which are also added to the current timing span and
+    # run metrics. Runs in the rclone daemon when that's enabled (see rclone_daemon),
+    # otherwise as an rclone process.
+    display = None if progress else RcloneProgress()
+    with span(f"rclone {args[0]}"):
+        daemon = rclone_daemon()
+        rc_request = __rc_transfer_request(args) if daemon else None
+        try:
+            if rc_request:
+                (stats, failure) = daemon.run_job(*rc_request, progress or display.update)
+            else:
+                (stats, failure) = __rclone_transfer_process(args, progress, display)
+        finally:
+            if display: display.clear()
+
+        span_add(stats.bytes, stats.transfers + stats.deletes)
+        if args[0] in ("copy", "sync"):
+            # Into the local backup, unlike 'delete' which cleans up the remote
+            report_count("bytes_transferred", stats.bytes)
+            report_count("files_transferred", stats.transfers)
+            report_count("files_deleted", stats.deletes)
+
+    print(f"rclone {args[0]} finished: {stats.summary()}")
+    if failure:
+        raise failure
+    return stats
+
+def __rclone_transfer_process(
+    args: list[str], progress: Callable[[RcloneStats], None] | None, display: "RcloneProgress | None"
+) -> tuple[RcloneStats, Exception | None]:
+    # Runs rclone with JSON logging, parsing the stats it logs every
+    # RCLONE_STATS_INTERVAL. Other log messages are passed through to logging.
+    # stdin and stdout aren't a terminal here, so a container is run without
+    # docker's -i/-t (which would fail with "the input device is not a TTY").
+    (cmd, env) = __rclone_command([
+        *args,
+        "--use-json-log",
+        "--stats", RCLONE_STATS_INTERVAL,
+        "--stats-log-level", "NOTICE",
+    ], docker_flags=[])
+    log_command(cmd)
+    stats = RcloneStats()
+    # The log goes to stderr, which is merged into stdout so it's read
+    # in order with any plain output
+    process = subprocess.Popen(
+        cmd, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        text=True, errors="replace", bufsize=1)
+    try:
+        for line in process.stdout:
+            entry = __parse_log_line(line)
+            if entry is None:
+                if display: display.clear()
+                print(line.rstrip())
+            elif "stats" in entry:
+                stats = RcloneStats.from_json(entry["stats"])
+                (progress or display.update)(stats)
+            else:
+                if display: display.clear()
+                level = RCLONE_LOG_LEVELS.get(entry.get("level"), logging.INFO)
+                obj = f"{entry['object']}: " if entry.get("object") else ""
+                logging.log(level, f"{obj}{entry.get('msg', '').rstrip()}")
+    except BaseException:
+        # Nothing is reading the pipe anymore, so rclone could
+        # block on it and never exit
+        process.kill()
+        raise
+    finally:
+        returncode = process.wait()
+        process.stdout.close()
+
+    return (stats, subprocess.CalledProcessError(returncode, cmd) if returncode != 0 else None)
+
+def __rc_transfer_request(args: list[str]) -> tuple[str, dict] | None:
+    # Translates rclone command line args into an rc method and params, e.g.
+    #   sync --exclude /Takeout/ remote:/ /backup/
+    # becomes
+    #   sync/sync { srcFs: "remote:/", dstFs: "/backup/", _filter: { ExcludeRule: ["/Takeout/"] } }
+    # Returns None for commands or flags that don't have a translation here,
+    # which are then run as an rclone process instead.
+    (command, flags, paths) = (args[0], {}, [])
+    rest = list(args[1:])
+    while rest:
+        arg = str(rest.pop(0))
+        if arg in RCLONE_RC_FILTER_FLAGS and rest:
+            (key, is_list) = RCLONE_RC_FILTER_FLAGS[arg]
+            value = str(rest.pop(0))
+            flags.setdefault("_filter", {})
+            if is_list:
+                flags["_filter"].setdefault(key, []).append(value)
+            else:
+                flags["_filter"][key] = value
+        elif arg in RCLONE_RC_CONFIG_FLAGS:
+            flags.setdefault("_config", {})[RCLONE_RC_CONFIG_FLAGS[arg]] = True
+        elif arg.startswith("-"):
+            return None
+        else:
+            paths.append(arg)
+
+    if command in ("copy", "sync") and len(paths) == 2:
+        return (f"sync/{command}", { "srcFs": paths[0], "dstFs": paths[1], **flags })
+    if command == "delete" and len(paths) == 1:
+        return ("operations/delete", { "fs": paths[0], **flags })
+    return None
+
+def __parse_log_line(line: str) -> dict | None:
+    if not line.startswith("{"):
+        return None
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return None
+    return entry if isinstance(entry, dict) else None
+
+__daemon = None
+
+def rclone_daemon() -> "RcloneDaemon | None":
+    # The 'rclone rcd' that rclone operations are sent to when CLOUD_BACKUP_RCLONE_RCD
+    # is on, rather than starting an rclone process (or container) for each one.
+    # Started on first use and stopped when this process exits. Processes forked
+    # after it's started, e.g. 'run-all' jobs, share it.
+    global __daemon
+    if not RCLONE_RCD:
+        return None
+    if __daemon is None:
+        __daemon = __start_rclone_daemon()
+    return __daemon
+
+def __start_rclone_daemon() -> "RcloneDaemon":
+    import urllib.error
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    auth = ("cloud-backup", secrets.token_urlsafe(24))
+
+    # Credentials are passed in the environment rather than as args, so they
+    # don't show up in the process list. In a container, the rc API has to
+    # listen on all of the container's interfaces to be reachable through
+    # the published port, which is itself only bound to localhost.
+    is_native = shutil.which("rclone") is not None
+    (cmd, env) = __rclone_command(
+        ["rcd", "--rc-addr", f"{'127.0.0.1' if is_native else '0.0.0.0'}:{port}"],
+        docker_flags=["-p", f"127.0.0.1:{port}:{port}", "-e", "RCLONE_RC_USER", "-e", "RCLONE_RC_PASS"])
+    env = { **(env or os.environ), "RCLONE_RC_USER": auth[0], "RCLONE_RC_PASS": auth[1] }
+    log_file = backup_tmpd().joinpath(f"rclone-rcd.{port}.log")
+
+    print(f"Starting rclone daemon on port {port}...")
+    log_command(cmd)
+    with open(log_file, "w") as log:
+        process = subprocess.Popen(cmd, env=env, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+    daemon = RcloneDaemon(process, f"http://127.0.0.1:{port}/", auth)
+    atexit.register(daemon.stop)
+
+    started = time.monotonic()
+    while True:
+        if process.poll() is not None:
+            error(f"rclone daemon exited with code {process.returncode}, see {log_file}")
+        try:
+            daemon.call("rc/noop")
+            break
+        except (urllib.error.URLError, ConnectionError):
+            if time.monotonic() - started > RCLONE_RCD_START_SECS:
+                daemon.stop()
+                error(f"rclone daemon didn't start within {RCLONE_RCD_START_SECS}s, see {log_file}")
+            time.sleep(0.2)
+    logging.debug(f"rclone daemon started in {time.monotonic() - started:.1f}s, logging to {log_file}")
+    return daemon
+
 def __rclone_run(args: list[str], **kwargs) -> CompletedProcess:
+    (cmd, env) = __rclone_command(args)
+    return run_command(f"rclone {args[0]}", cmd, env=env, **kwargs)
+
+def __rclone_command(args: list[str], docker_flags: list[str] | None = None) -> tuple[list[str], dict[str, str] | None]:
+    # Returns the command to run rclone with the given args and the
+    # environment to run it in (None to inherit this process's).
+    # docker_flags replaces the flags for terminal interactivity
+    # when rclone is run in a container.
     os.makedirs(RCLONE_CONFD, exist_ok=True)
 
     if shutil.which("rclone") is not None:
         cmd = ['rclone', *shell.stringify_args(args)]
-        log_command(cmd)
-        return subprocess.run(
-            cmd,
-            env=shell.env(RCLONE_CONFIG=RCLONE_CONFIG),
-            **kwargs)
+        return (cmd, shell.env(RCLONE_CONFIG=RCLONE_CONFIG))
     
     cmd = [
         'docker', 'run',
         '--rm',
-        *shell.docker_flags(),
+        *(shell.docker_flags() if docker_flags is None else docker_flags),
         '-v', '/etc/localtime:/etc/localtime:ro',
         '-v', '/etc/timezone:/etc/timezone:ro',
         '-v', f'{RCLONE_CONFD}:{RCLONE_CONFD}',
@@ -68,11 +331,112 @@ def __rclone_run(args: list[str], **kwargs) -> CompletedProcess:
         '-e', f'RCLONE_CONFIG={RCLONE_CONFIG}',
         'rclone/rclone', *shell.stringify_args(args)
     ]
-    log_command(cmd)
-    return subprocess.run(cmd, **kwargs)
+    return (cmd, None)
+
+
+class RcloneProgress():
+    # Shows rclone stats as a single line that's redrawn in place on a terminal,
+    # or as a line printed every RCLONE_PROGRESS_LOG_SECS otherwise
+    def __init__(self):
+        self.is_tty = sys.stdout.isatty()
+        self.shown = False
+        self.last_printed = time.monotonic()
+
+    def update(self, stats: RcloneStats) -> None:
+        if self.is_tty:
+            sys.stdout.write(f"\r\x1b[K{stats.progress()}")
+            sys.stdout.flush()
+            self.shown = True
+        elif time.monotonic() - self.last_printed >= RCLONE_PROGRESS_LOG_SECS:
+            print(stats.progress())
+            self.last_printed = time.monotonic()
+
+    def clear(self) -> None:
+        # Called before anything else is printed, so it doesn't
+        # end up on the same line as the progress
+        if self.shown:
+            sys.stdout.write("\r\x1b[K")
+            sys.stdout.flush()
+            self.shown = False
+
+
+class RcloneRcError(Exception):
+    pass
+
+
+class RcloneDaemon():
+    # A running 'rclone rcd', driven over its HTTP remote control API
+    # (https://rclone.org/rc/). Transfers run as async jobs, so several
+    # can run in the same daemon at once, each with its own stats group.
+    def __init__(self, process: subprocess.Popen, url: str, auth: tuple[str, str]):
+        self.process = process
+        self.url = url
+        self.pid = os.getpid()
+        self.auth_header = "Basic " + base64.b64encode(f"{auth[0]}:{auth[1]}".encode()).decode()
+
+    def call(self, method: str, params: dict | None = None) -> dict:
+        # urllib is only needed in daemon mode, so it's imported here
+        # rather than at module load
+        import urllib.error
+        import urllib.request
+
+        request = urllib.request.Request(
+            self.url + method,
+            data=json.dumps(params or {}).encode(),
+            headers={ "Content-Type": "application/json", "Authorization": self.auth_header },
+            method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=RCLONE_RC_TIMEOUT_SECS) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.load(e).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise RcloneRcError(f"rclone rc {method} failed: {message}") from e
+
+    def run_job(
+        self, method: str, params: dict, progress: Callable[[RcloneStats], None]
+    ) -> tuple[RcloneStats, Exception | None]:
+        # Starts an async job and polls it (and its stats) until it finishes
+        logging.debug(f"Running rclone rc {method} {json.dumps(params)}")
+        job_id = self.call(method, { **params, "_async": True })["jobid"]
+        group = f"job/{job_id}"
+        try:
+            while True:
+                status = self.call("job/status", { "jobid": job_id })
+                stats = RcloneStats.from_json(self.call("core/stats", { "group": group }))
+                if status.get("finished"): break
+                progress(stats)
+                time.sleep(RCLONE_RC_POLL_SECS)
+        except KeyboardInterrupt:
+            self.call("job/stop", { "jobid": job_id })
+            raise
+        self.call("core/stats-delete", { "group": group })
+
+        if status.get("success"):
+            return (stats, None)
+        return (stats, RcloneRcError(f"rclone rc {method} failed: {status.get('error')}"))
+
+    def stop(self) -> None:
+        # Only the process that started the daemon stops it,
+        # not processes forked from it
+        if os.getpid() != self.pid or self.process.poll() is not None:
+            return
+        try:
+            self.call("core/quit")
+            self.process.wait(timeout=10)
+        except (OSError, RcloneRcError, subprocess.TimeoutExpired):
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
 
 
 class RcloneService(Service):
+    uses_rclone = True
+
     def __init__(self, app_slug: str, username: str):
         super().__init__(require_username(username))
         
@@ -0,0 +1,210 @@
+from dataclasses import dataclass, field
+import errno
+import logging
+import os
+from pathlib import Path
+import shutil
+import stat
+from typing import Callable
+
+from ..lib import *
+
+
+SYNC_ACTIONS = ["created", "updated", "deleted"]
+COPY_BUFFER_SIZE = 1024 * 1024
+COPY_RANGE_SIZE = 64 * 1024 * 1024
+
+# copy_file_range isn't supported across some filesystems and kernels,
+# in which case files are copied by reading and writing instead
+COPY_RANGE_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM}
+LINK_FALLBACK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP}
+
+
+@dataclass
+class SyncChange:
+    action: str  # One of SYNC_ACTIONS
+    path: str    # Relative to the destination folder
+    size: int = 0
+
+
+@dataclass
+class SyncResult:
+    changes: list[SyncChange] = field(default_factory=list)
+    unchanged: int = 0
+
+    def count(self, action: str) -> int:
+        return sum(1 for change in self.changes if change.action == action)
+
+    def summary(self) -> str:
+        counts = [f"{self.count(action)} {action}" for action in SYNC_ACTIONS]
+        return ", ".join(counts + [f"{self.unchanged} unchanged"])
+
+    def transferred_bytes(self) -> int:
+        return sum(change.size for change in self.changes if change.action != "deleted")
+
+    def log_changes(self) -> None:
+        for change in self.changes:
+            logging.debug(f"{change.action.capitalize()} '{change.path}'")
+
+
+@dataclass
+class SyncOptions:
+    update: bool = False
+    ignore_existing: bool = False
+    delete: bool = False
+    link: bool = False
+    include: Callable[[str], bool] | None = None
+
+
+def sync_tree(
+    source_dir: Path, dest_dir: Path, update: bool = False, ignore_existing: bool = False,
+    delete: bool = False, link: bool = False, include: Callable[[str], bool] | None = None
+) -> SyncResult:
+    # In-process equivalent of 'rsync --archive <source_dir>/ <dest_dir>/',
+    # walking both trees once with scandir and comparing stat results.
+    # Options follow the rsync flags of the same name:
+    #   update           Skip files that are newer in the destination
+    #   ignore_existing  Skip files that already exist in the destination
+    #   delete           Delete files in the destination that aren't in the source
+    # and additionally:
+    #   link             Hard-link files rather than copying them, where possible
+    #   include          Filter on file names, applied to both sides like an
+    #                    rsync include/exclude rule (files that don't match are
+    #                    neither transferred nor deleted)
+    options = SyncOptions(update, ignore_existing, delete, link, include)
+    result = SyncResult()
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    __sync_dir(__scan_dir(source_dir), str(dest_dir), "", options, result)
+    __copy_attrs(os.stat(source_dir), str(dest_dir))
+    __record(result)
+    return result
+
+def sync_files(
+    source_files: dict[str, Path], dest_dir: Path, update: bool = False, ignore_existing: bool = False,
+    delete: bool = False, link: bool = False, include: Callable[[str], bool] | None = None
+) -> SyncResult:
+    # Same as sync_tree, but for a flat set of files given as { dest name: source file },
+    # which allows files to be renamed on the way into the destination
+    options = SyncOptions(update, ignore_existing, delete, link, include)
+    result = SyncResult()
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    sources = { name: (str(path), os.lstat(path)) for name, path in source_files.items() }
+    __sync_dir(sources, str(dest_dir), "", options, result)
+    __record(result)
+    return result
+
+
+def try_hard_link(source_path: str | Path, dest_path: str | Path) -> bool:
+    # Returns False where hard links aren't possible (e.g. across filesystems)
+    try:
+        os.link(source_path, dest_path, follow_symlinks=False)
+        return True
+    except OSError as e:
+        if e.errno not in LINK_FALLBACK_ERRNOS:
+            raise
+        return False
+
+
+def __record(result: SyncResult) -> None:
+    # Adds to the current run's timing span and metrics (see lib/timing.py)
+    span_add(result.transferred_bytes(), len(result.changes))
+    report_count("bytes_transferred", result.transferred_bytes())
+    for action, counter in [("created", "files_added"), ("updated", "files_updated"), ("deleted", "files_deleted")]:
+        report_count(counter, sum(1 for change in result.changes
+            if change.action == action and not change.path.endswith("/")))
+
+def __scan_dir(dir_path: str | Path) -> dict[str, tuple[str, os.stat_result]]:
+    with os.scandir(dir_path) as entries:
+        return { entry.name: (entry.path, entry.stat(follow_symlinks=False)) for entry in entries }
+
+def __sync_dir(
+    sources: dict[str, tuple[str, os.stat_result]], dest_dir: str, relative_dir: str,
+    options: SyncOptions, result: SyncResult
+) -> None:
+    dests = __scan_dir(dest_dir)
+
+    for name, (source_path, source_stat) in sorted(sources.items()):
+        is_dir = stat.S_ISDIR(source_stat.st_mode)
+        if not is_dir and options.include and not options.include(name): continue
+        relative_path = relative_dir + name
+        dest_path = os.path.join(dest_dir, name)
+        dest_stat = dests[name][1] if name in dests else None
+
+        # A file replacing a folder (or vice versa) removes what was there first
+        if dest_stat and stat.S_ISDIR(dest_stat.st_mode) != is_dir:
+            __remove(dest_path, dest_stat)
+            result.changes.append(SyncChange("deleted", relative_path))
+            dest_stat = None
+
+        if is_dir:
+            if dest_stat is None:
+                os.mkdir(dest_path)
+                result.changes.append(SyncChange("created", relative_path + "/"))
+            __sync_dir(__scan_dir(source_path), dest_path, relative_path + "/", options, result)
+            __copy_attrs(source_stat, dest_path)
+        elif dest_stat and (options.ignore_existing or not __is_changed(source_stat, dest_stat, options.update)):
+            result.unchanged += 1
+        else:
+            __transfer(source_path, source_stat, dest_path, options.link)
+            result.changes.append(SyncChange("updated" if dest_stat else "created", relative_path, source_stat.st_size))
+
+    if options.delete:
+        for name, (dest_path, dest_stat) in sorted(dests.items()):
+            if name in sources: continue
+            if not stat.S_ISDIR(dest_stat.st_mode) and options.include and not options.include(name): continue
+            __remove(dest_path, dest_stat)
+            result.changes.append(SyncChange("deleted", relative_dir + name, dest_stat.st_size))
+
+def __is_changed(source_stat: os.stat_result, dest_stat: os.stat_result, update: bool) -> bool:
+    # rsync's quick check: size or (whole-second) mtime differ. With 'update',
+    # files that are newer in the destination are left alone.
+    if stat.S_IFMT(source_stat.st_mode) != stat.S_IFMT(dest_stat.st_mode):
+        return True
+    if update and int(dest_stat.st_mtime) > int(source_stat.st_mtime):
+        return False
+    return int(source_stat.st_mtime) != int(dest_stat.st_mtime) or source_stat.st_size != dest_stat.st_size
+
+def __transfer(source_path: str, source_stat: os.stat_result, dest_path: str, link: bool) -> None:
+    # Writes to a temp file alongside the destination and renames it into
+    # place, so an interrupted transfer never leaves a truncated file behind
+    (dest_parent, dest_name) = os.path.split(dest_path)
+    tmp_path = os.path.join(dest_parent, f".{dest_name}.partial")
+    if os.path.lexists(tmp_path):
+        os.unlink(tmp_path)
+    try:
+        if stat.S_ISLNK(source_stat.st_mode):
+            os.symlink(os.readlink(source_path), tmp_path)
+        elif not (link and try_hard_link(source_path, tmp_path)):
+            __copy_file(source_path, tmp_path)
+            __copy_attrs(source_stat, tmp_path)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+def __copy_file(source_path: str, dest_path: str) -> None:
+    # copy_file_range lets the kernel copy (or reflink, on filesystems that
+    # support it) without passing the data through user space
+    with open(source_path, "rb") as source, open(dest_path, "wb") as dest:
+        if hasattr(os, "copy_file_range"):
+            try:
+                while os.copy_file_range(source.fileno(), dest.fileno(), COPY_RANGE_SIZE): pass
+                return
+            except OSError as e:
+                if e.errno not in COPY_RANGE_FALLBACK_ERRNOS:
+                    raise
+                source.seek(0)
+                dest.seek(0)
+                dest.truncate()
+        shutil.copyfileobj(source, dest, COPY_BUFFER_SIZE)
+
+def __copy_attrs(source_stat: os.stat_result, dest_path: str) -> None:
+    os.chmod(dest_path, stat.S_IMODE(source_stat.st_mode))
+    os.utime(dest_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+
+def __remove(path: str, path_stat: os.stat_result) -> None:
+    if stat.S_ISDIR(path_stat.st_mode):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
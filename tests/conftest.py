@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Some modules read these when they're imported, so they're set before any
+# tests are collected. Tests that write backup data point them at tmp_path.
+os.environ.setdefault("CLOUD_BACKUP_CONFD", tempfile.mkdtemp(prefix="cloud-backup-confd-"))
+os.environ.setdefault("CLOUD_BACKUP_DATAD", tempfile.mkdtemp(prefix="cloud-backup-datad-"))
@@ -0,0 +1,150 @@
+import gzip
+import io
+import json
+import os
+import tarfile
+import zipfile
+
+from cloud_services_backup_cli.tools.archive import (
+    ArchiveIndex, ArchiveMember, extract_archive, is_archive_member_newer, scan_archive)
+
+
+MTIME = 1_600_000_000
+
+
+def write_tgz(path, files: dict[str, bytes], mtime: int = MTIME):
+    with tarfile.open(path, "w:gz") as t:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = mtime
+            t.addfile(info, io.BytesIO(data))
+    return path
+
+def write_zip(path, files: dict[str, bytes]):
+    with zipfile.ZipFile(path, "w") as z:
+        for name, data in files.items():
+            z.writestr(name, data)
+    return path
+
+def names(members) -> list[str]:
+    return sorted(m.name for _, m in members)
+
+
+def test_scans_tgz_and_zip(tmp_path):
+    tgz = write_tgz(tmp_path / "a.tgz", { "Takeout/Drive/a.txt": b"aa" })
+    zip = write_zip(tmp_path / "b.zip", { "Takeout/Mail/": b"", "Takeout/Mail/b.mbox": b"bbb" })
+    assert scan_archive(tgz) == [ArchiveMember("Takeout/Drive/a.txt", 2, MTIME, 0o644, False)]
+    assert [(m.name, m.size, m.is_dir) for m in scan_archive(zip)] == [
+        ("Takeout/Mail", 0, True), ("Takeout/Mail/b.mbox", 3, False)]
+
+def test_index_put_and_is_current(tmp_path):
+    archive = write_tgz(tmp_path / "a.tgz", { "Takeout/Drive/a.txt": b"a" })
+    index = ArchiveIndex(tmp_path / "index.json.gz")
+    assert not index.is_current(archive)
+    index.put(archive, scan_archive(archive))
+    assert index.is_current(archive) and index.changed
+
+    os.utime(archive, (MTIME, MTIME))
+    assert not index.is_current(archive)
+
+def test_index_update_scans_new_and_drops_removed(tmp_path):
+    a = write_tgz(tmp_path / "a.tgz", { "Takeout/Drive/a.txt": b"a" })
+    b = write_zip(tmp_path / "b.zip", { "Takeout/Drive/b.txt": b"b" })
+    bad = tmp_path / "c.tgz"
+    bad.write_bytes(b"not a tgz")
+    index = ArchiveIndex(tmp_path / "index.json.gz")
+    assert index.update([a, b, bad], jobs=2) == ["c.tgz"]
+    assert names(index.members()) == ["Takeout/Drive/a.txt", "Takeout/Drive/b.txt"]
+
+    a.unlink()
+    assert index.update([b], jobs=2) == []
+    assert list(index.archives) == ["b.zip"]
+    assert names(index.members()) == ["Takeout/Drive/b.txt"]
+
+def test_index_save_and_load(tmp_path):
+    archive = write_tgz(tmp_path / "a.tgz", { "Takeout/Drive/a.txt": b"a" })
+    index_file = tmp_path / "index.json.gz"
+    index = ArchiveIndex(index_file)
+    index.update([archive], jobs=1)
+    index.save()
+    assert not index.changed
+
+    loaded = ArchiveIndex(index_file)
+    assert loaded.is_current(archive)
+    assert loaded.archive_members("a.tgz") == index.archive_members("a.tgz")
+    with gzip.open(index_file, "rt") as f:
+        assert json.load(f)["version"] == ArchiveIndex.VERSION
+
+def test_index_ignores_other_versions_and_unreadable_files(tmp_path):
+    index_file = tmp_path / "index.json.gz"
+    with gzip.open(index_file, "wt") as f:
+        json.dump({ "version": ArchiveIndex.VERSION + 1, "archives": { "a.tgz": {} } }, f)
+    assert ArchiveIndex(index_file).archives == {}
+
+    index_file.write_bytes(b"not gzip")
+    assert ArchiveIndex(index_file).archives == {}
+
+def test_index_members_and_subdirs_by_folder(tmp_path):
+    index = ArchiveIndex(tmp_path / "index.json.gz")
+    index.put(write_tgz(tmp_path / "b.tgz", {
+        "Takeout/Google Photos/Trip/a.jpg": b"a",
+        "Takeout/Google Photos/Trip/Day 1/b.jpg": b"b",
+        "Takeout/Drive/doc.txt": b"d",
+    }), scan_archive(tmp_path / "b.tgz"))
+    index.put(write_zip(tmp_path / "a.zip", {
+        "Takeout/Google Photos/Home/": b"",
+        "Takeout/Google Photos/Home/Sub/Deeper/c.jpg": b"c",
+    }), scan_archive(tmp_path / "a.zip"))
+
+    assert index.subdirs("Takeout") == ["Drive", "Google Photos"]
+    assert index.subdirs("Takeout/Google Photos") == ["Home", "Trip"]
+    assert index.subdirs("Takeout/Google Photos/Trip") == ["Day 1"]
+    assert index.subdirs("Takeout/Google Photos/Home/Sub") == ["Deeper"]
+    assert index.subdirs("Takeout/Missing") == []
+    assert names(index.members("Takeout/Google Photos/Trip")) == [
+        "Takeout/Google Photos/Trip/Day 1/b.jpg", "Takeout/Google Photos/Trip/a.jpg"]
+    assert names(index.members("Takeout/Google Photos/Home/Sub/Deeper")) == [
+        "Takeout/Google Photos/Home/Sub/Deeper/c.jpg"]
+    # Ordered by archive name, then archive order
+    assert [archive for archive, _ in index.members("Takeout")] == ["a.zip", "a.zip", "b.tgz", "b.tgz", "b.tgz"]
+
+    # Queries see archives put after the first one
+    index.put(write_tgz(tmp_path / "c.tgz", { "Takeout/Mail/x.mbox": b"x" }), scan_archive(tmp_path / "c.tgz"))
+    assert index.subdirs("Takeout") == ["Drive", "Google Photos", "Mail"]
+
+def test_is_archive_member_newer(tmp_path):
+    member = ArchiveMember("a.txt", 3, MTIME, 0o644, False)
+    dest = tmp_path / "a.txt"
+    assert is_archive_member_newer(member, dest)
+
+    dest.write_bytes(b"abc")
+    os.utime(dest, (MTIME, MTIME))
+    assert not is_archive_member_newer(member, dest)
+    os.utime(dest, (MTIME - 10, MTIME - 10))
+    assert is_archive_member_newer(member, dest)
+    os.utime(dest, (MTIME + 10, MTIME + 10))
+    assert not is_archive_member_newer(member, dest)
+    dest.write_bytes(b"abcd")
+    os.utime(dest, (MTIME, MTIME))
+    assert is_archive_member_newer(member, dest)
+
+def test_extract_leaves_unchanged_members_in_place(tmp_path):
+    extract_dir = tmp_path / "export"
+    archive = write_tgz(tmp_path / "a.tgz", { "Takeout/same.txt": b"same", "Takeout/changed.txt": b"old" })
+    result = extract_archive(archive, extract_dir)
+    assert (result.bytes_written, result.members_unchanged) == (7, 0)
+    same_ino = (extract_dir / "Takeout/same.txt").stat().st_ino
+
+    write_tgz(archive, { "Takeout/same.txt": b"same", "Takeout/changed.txt": b"new!" })
+    result = extract_archive(archive, extract_dir)
+    assert (result.bytes_written, result.members_unchanged) == (4, 1)
+    assert len(result.members) == 2
+    assert (extract_dir / "Takeout/same.txt").stat().st_ino == same_ino
+    assert (extract_dir / "Takeout/changed.txt").read_bytes() == b"new!"
+
+def test_extract_limited_to_folders(tmp_path):
+    archive = write_zip(tmp_path / "a.zip", { "Takeout/Photos/Trip/a.jpg": b"a", "Takeout/Photos/Home/b.jpg": b"b" })
+    result = extract_archive(archive, tmp_path / "export", include_folders=["takeout/photos/trip"])
+    assert (len(result.members), result.members_skipped) == (2, 1)
+    assert [p.name for p in (tmp_path / "export").rglob("*.jpg")] == ["a.jpg"]
@@ -0,0 +1,104 @@
+import io
+import os
+import tarfile
+
+import pytest
+
+from cloud_services_backup_cli.services.google_takeout import GoogleTakeout
+
+
+EXPORT = "takeout-20250601T000000Z"
+
+
+@pytest.fixture
+def takeout(tmp_path, monkeypatch):
+    monkeypatch.setenv("CLOUD_BACKUP_DATAD", str(tmp_path))
+    return GoogleTakeout("me")
+
+def write_part(takeout, part: int, files: dict[str, bytes], mtime: int = 1_700_000_000):
+    archive = takeout.user_backupd_archives.joinpath(f"{EXPORT}-{part:03}.tgz")
+    with tarfile.open(archive, "w:gz") as t:
+        for name, data in files.items():
+            info = tarfile.TarInfo(f"Takeout/{name}")
+            info.size = len(data)
+            info.mtime = 1_600_000_000
+            t.addfile(info, io.BytesIO(data))
+    os.utime(archive, (mtime, mtime))
+    return archive
+
+def extracted(takeout):
+    root = takeout.user_backupd_archives.joinpath(EXPORT, "Takeout")
+    return sorted(str(p.relative_to(root)) for p in root.rglob("*") if p.is_file())
+
+def extracting(capsys) -> str | None:
+    lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith("Extracting ") and " of " in line]
+    return lines[0] if lines else None
+
+
+def test_skips_parts_already_extracted(takeout, capsys):
+    write_part(takeout, 1, { "Drive/a.txt": b"a" })
+    write_part(takeout, 2, { "Drive/b.txt": b"b" })
+    takeout.extract_archives("copy")
+    assert extracting(capsys).startswith("Extracting 2 of 2 archive(s)")
+    assert extracted(takeout) == ["Drive/a.txt", "Drive/b.txt"]
+
+    takeout.extract_archives("copy")
+    assert extracting(capsys) is None
+
+    write_part(takeout, 3, { "Drive/c.txt": b"c" })
+    takeout.extract_archives("copy")
+    assert extracting(capsys).startswith("Extracting 1 of 3 archive(s)")
+    assert extracted(takeout) == ["Drive/a.txt", "Drive/b.txt", "Drive/c.txt"]
+
+def test_clears_files_of_changed_and_removed_parts(takeout, capsys):
+    write_part(takeout, 1, { "Drive/a.txt": b"a" })
+    write_part(takeout, 2, { "Drive/old.txt": b"old", "Drive/kept.txt": b"kept" })
+    part3 = write_part(takeout, 3, { "Drive/gone.txt": b"gone" })
+    takeout.extract_archives("copy")
+    capsys.readouterr()
+
+    write_part(takeout, 2, { "Drive/new.txt": b"new", "Drive/kept.txt": b"kept" }, mtime=1_700_000_100)
+    part3.unlink()
+    write_part(takeout, 4, { "Drive/d.txt": b"d" })
+    takeout.extract_archives("copy")
+    out = capsys.readouterr().out
+    assert "1 unchanged member(s) left in place" in out
+    assert f"Deleting 1 file(s) extracted from removed archive {EXPORT}-003.tgz..." in out
+    assert f"Extracting 2 of 3 archive(s) for export '{EXPORT}'..." in out
+    assert extracted(takeout) == ["Drive/a.txt", "Drive/d.txt", "Drive/kept.txt", "Drive/new.txt"]
+
+def test_extracts_all_parts_again_after_corrupt_journal(takeout, capsys):
+    write_part(takeout, 1, { "Drive/a.txt": b"a" })
+    write_part(takeout, 2, { "Drive/b.txt": b"b" })
+    takeout.extract_archives("copy")
+    capsys.readouterr()
+
+    journal_file = takeout.user_backupd_archives.joinpath(EXPORT, ".extract-journal.json")
+    journal_file.write_text(journal_file.read_text()[:20])
+    takeout.extract_archives("copy")
+    assert extracting(capsys).startswith("Extracting 2 of 2 archive(s)")
+
+    takeout.extract_archives("copy")
+    assert extracting(capsys) is None
+
+def test_limited_extraction_is_recorded_per_folder(takeout, capsys):
+    write_part(takeout, 1, { "Google Photos/Trip/a.jpg": b"a", "Google Photos/Home/b.jpg": b"b" })
+    takeout.extract_archives("copy", ["Takeout/Google Photos/Trip"])
+    assert extracting(capsys).startswith("Extracting 1 of 1 archive(s)")
+    assert extracted(takeout) == ["Google Photos/Trip/a.jpg"]
+
+    takeout.extract_archives("copy", ["Takeout/Google Photos/Trip"])
+    assert extracting(capsys) is None
+
+    takeout.extract_archives("copy")
+    assert extracting(capsys).startswith("Extracting 1 of 1 archive(s)")
+    assert extracted(takeout) == ["Google Photos/Home/b.jpg", "Google Photos/Trip/a.jpg"]
+
+def test_reports_archives_as_they_finish(takeout, capsys):
+    write_part(takeout, 1, { "Drive/a.txt": b"a" })
+    write_part(takeout, 2, { "Drive/b.txt": b"b" })
+    takeout.extract_archives("copy")
+    lines = capsys.readouterr().out.splitlines()
+    assert not any(line.startswith("Extracting archive ") for line in lines)
+    assert sorted(line.split(",")[0] for line in lines if line.startswith("Extracted archive ")) == [
+        f"Extracted archive {EXPORT}-001.tgz", f"Extracted archive {EXPORT}-002.tgz"]
@@ -0,0 +1,87 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+import pytest
+
+from cloud_services_backup_cli.lib.http import HttpClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Serves the server's queued (status, headers, body) responses in order,
+    # recording the headers of each request it gets
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        (status, headers, body) = self.server.responses.pop(0)
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.responses = []
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/repos"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_retries_after_429_with_retry_after(server, tmp_path):
+    server.responses = [
+        (429, { "Retry-After": "0" }, None),
+        (200, {}, ["repo"]),
+    ]
+    result = HttpClient(tmp_path).get_json(server.url)
+    assert result.data == ["repo"]
+    assert len(server.requests) == 2
+
+def test_retries_after_403_rate_limit_reset(server, tmp_path):
+    server.responses = [
+        (403, { "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time())) }, None),
+        (200, {}, ["repo"]),
+    ]
+    result = HttpClient(tmp_path).get_json(server.url)
+    assert result.data == ["repo"]
+    assert len(server.requests) == 2
+
+def test_returns_403_without_rate_limit(server, tmp_path):
+    server.responses = [(403, { "X-RateLimit-Remaining": "10" }, None)]
+    with pytest.raises(Exception, match="403"):
+        HttpClient(tmp_path).get_json(server.url)
+    assert len(server.requests) == 1
+
+def test_serves_304_from_etag_cache(server, tmp_path):
+    server.responses = [
+        (200, { "ETag": '"v1"', "Link": '<http://example.com/?page=2>; rel="next"' }, ["repo"]),
+        (304, { "ETag": '"v1"' }, None),
+    ]
+    first = HttpClient(tmp_path).get_json(server.url)
+    second = HttpClient(tmp_path).get_json(server.url)
+    assert (first.data, first.cached) == (["repo"], False)
+    assert (second.data, second.cached) == (["repo"], True)
+    assert second.headers == first.headers
+    assert server.requests[1]["If-None-Match"] == '"v1"'
+
+def test_serves_304_from_last_modified_cache(server, tmp_path):
+    last_modified = "Wed, 01 Jan 2025 00:00:00 GMT"
+    server.responses = [
+        (200, { "Last-Modified": last_modified }, ["repo"]),
+        (304, {}, None),
+    ]
+    HttpClient(tmp_path).get_json(server.url)
+    result = HttpClient(tmp_path).get_json(server.url)
+    assert (result.data, result.cached) == (["repo"], True)
+    assert server.requests[1]["If-Modified-Since"] == last_modified
@@ -0,0 +1,228 @@
+import atexit
+from datetime import datetime
+import json
+import os
+from pathlib import Path
+import struct
+import sys
+import time
+
+import piexif
+import pytest
+
+from cloud_services_backup_cli.tools import media
+from cloud_services_backup_cli.tools.media import (
+    MediaFileInfo, MediaTimestampCache, get_create_timestamps, load_exif_from_header)
+
+
+TAKEN = b"2021:02:03 04:05:06"
+
+
+def exif_payload() -> bytes:
+    # "Exif\0\0" followed by the TIFF data
+    return piexif.dump({ "Exif": { piexif.ExifIFD.DateTimeOriginal: TAKEN } })
+
+def jpeg(*segments: bytes) -> bytes:
+    return b"\xff\xd8" + b"".join(segments) + b"\xff\xda\x00\x02" + b"\x00" * 16 + b"\xff\xd9"
+
+def segment(code: int, payload: bytes) -> bytes:
+    return bytes([0xFF, code]) + struct.pack(">H", len(payload) + 2) + payload
+
+def box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + box_type + payload
+
+def full_box(box_type: bytes, version: int, payload: bytes) -> bytes:
+    return box(box_type, bytes([version, 0, 0, 0]) + payload)
+
+def heif(exif: bytes | None, in_idat: bool = False, iloc_cut: int = 0) -> bytes:
+    # ftyp, then a meta box with the Exif item (id 2) listed in iinf and
+    # located by iloc, either in idat or in an mdat after the meta box
+    item_data = struct.pack(">I", 0) + exif[6:] if exif is not None else b""
+    ftyp = box(b"ftyp", b"heic\x00\x00\x00\x00mif1heic")
+    infe = [full_box(b"infe", 2, struct.pack(">HH", 1, 0) + b"hvc1\x00")]
+    if exif is not None:
+        infe.append(full_box(b"infe", 2, struct.pack(">HH", 2, 0) + b"Exif\x00"))
+    iinf = full_box(b"iinf", 0, struct.pack(">H", len(infe)) + b"".join(infe))
+
+    def meta(offset: int) -> bytes:
+        # iloc version 1: 4-byte offsets and lengths, no base offset or index
+        items = struct.pack(">HHHHII", 2, 1 if in_idat else 0, 0, 1, offset, len(item_data))
+        # iloc_cut drops bytes from the end of the item, as if truncated
+        items = items[:len(items) - iloc_cut]
+        iloc = full_box(b"iloc", 1, bytes([0x44, 0x00]) + struct.pack(">H", 1) + items)
+        boxes = [full_box(b"hdlr", 0, b"\x00" * 4 + b"pict" + b"\x00" * 13), iinf, iloc]
+        if in_idat:
+            boxes.append(box(b"idat", item_data))
+        return full_box(b"meta", 0, b"".join(boxes))
+
+    if in_idat:
+        return ftyp + meta(0)
+    # The mdat's position depends on the meta box's size, which doesn't
+    # depend on the offset written into it
+    data_offset = len(ftyp) + len(meta(0)) + 8
+    return ftyp + meta(data_offset) + box(b"mdat", item_data)
+
+def taken(exif_dict: dict) -> bytes:
+    return exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal]
+
+
+def test_reads_jpeg_exif(tmp_path):
+    file = tmp_path / "photo.jpg"
+    file.write_bytes(jpeg(segment(0xE0, b"JFIF\x00" + b"\x00" * 9), segment(0xE1, exif_payload())))
+    assert taken(load_exif_from_header(file)) == TAKEN
+
+def test_reads_jpeg_exif_after_fill_bytes_and_other_app1(tmp_path):
+    file = tmp_path / "photo.jpg"
+    file.write_bytes(jpeg(b"\xff", segment(0xE1, b"http://ns.adobe.com/xap/1.0/\x00"), segment(0xE1, exif_payload())))
+    assert taken(load_exif_from_header(file)) == TAKEN
+
+def test_jpeg_without_exif(tmp_path):
+    file = tmp_path / "photo.jpg"
+    file.write_bytes(jpeg(segment(0xE0, b"JFIF\x00" + b"\x00" * 9)))
+    assert load_exif_from_header(file) == {}
+
+def test_reads_tiff_exif(tmp_path):
+    file = tmp_path / "photo.tif"
+    file.write_bytes(exif_payload()[6:])
+    assert taken(load_exif_from_header(file)) == TAKEN
+
+@pytest.mark.parametrize("in_idat", [False, True])
+def test_reads_heif_exif(tmp_path, in_idat):
+    file = tmp_path / "photo.heic"
+    file.write_bytes(heif(exif_payload(), in_idat=in_idat))
+    assert taken(load_exif_from_header(file)) == TAKEN
+
+def test_heif_without_exif_item(tmp_path):
+    file = tmp_path / "photo.heic"
+    file.write_bytes(heif(None))
+    assert load_exif_from_header(file) == {}
+
+def test_unrecognized_or_empty_file(tmp_path):
+    (tmp_path / "empty.jpg").write_bytes(b"")
+    (tmp_path / "photo.png").write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 32)
+    assert load_exif_from_header(tmp_path / "empty.jpg") is None
+    assert load_exif_from_header(tmp_path / "photo.png") is None
+
+def test_malformed_heif_isnt_parsed(tmp_path):
+    file = tmp_path / "photo.heic"
+    file.write_bytes(heif(exif_payload(), iloc_cut=2))
+    assert load_exif_from_header(file) is None
+
+
+@pytest.fixture
+def exiftool_output(monkeypatch):
+    calls = []
+    def exiftool_pipe(*args):
+        calls.append(args)
+        return json.dumps([{ "SourceFile": args[-1], "DateTimeOriginal": "2019:08:07 06:05:04" }])
+    monkeypatch.setattr(media, "exiftool_pipe", exiftool_pipe)
+    return calls
+
+def test_create_timestamp_from_header_exif(tmp_path, exiftool_output):
+    file = tmp_path / "photo.heic"
+    file.write_bytes(heif(exif_payload()))
+    assert MediaFileInfo(file).get_create_timestamp() == datetime(2021, 2, 3, 4, 5, 6)
+    assert exiftool_output == []
+
+@pytest.mark.parametrize("name, data", [
+    ("photo.heic", heif(exif_payload(), iloc_cut=2)),
+    ("photo.heic", heif(exif_payload())[:60]),
+    ("photo.jpg", jpeg(segment(0xE1, exif_payload()))[:40]),
+    ("photo.jpg", b"\xff\xd8" + segment(0xE1, b"Exif\x00\x00MM\x00*\xff\xff\xff\xff")),
+])
+def test_falls_back_to_exiftool_on_malformed_headers(tmp_path, exiftool_output, name, data):
+    file = tmp_path / name
+    file.write_bytes(data)
+    assert MediaFileInfo(file).get_create_timestamp() == datetime(2019, 8, 7, 6, 5, 4)
+    assert len(exiftool_output) == 1
+
+
+FAKE_EXIFTOOL = """\
+import json, os, pathlib, sys
+# Stand-in for "exiftool -stay_open True -@ -", which records its pid in
+# PID_DIR while running and removes it when told to stop
+pid_file = pathlib.Path(os.environ["PID_DIR"], str(os.getpid()))
+pid_file.touch()
+args = []
+for line in sys.stdin:
+    arg = line.rstrip("\\n")
+    if arg.startswith("-execute"):
+        print(json.dumps([{ "SourceFile": args[-1], "DateTimeOriginal": "2019:08:07 06:05:04" }]))
+        print("{ready" + arg[len("-execute"):] + "}", flush=True)
+        args = []
+    elif args[-1:] == ["-stay_open"] and arg == "False":
+        pid_file.unlink()
+        break
+    else:
+        args.append(arg)
+"""
+
+def test_get_create_timestamps_stops_exiftool_workers(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "exiftool").write_text(f"#!{sys.executable}\n{FAKE_EXIFTOOL}")
+    (bin_dir / "exiftool").chmod(0o755)
+    pid_dir = tmp_path / "pids"
+    pid_dir.mkdir()
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("PID_DIR", str(pid_dir))
+    # Pool workers only run atexit handlers on some Python versions and start
+    # methods, so they're not relied on to stop exiftool
+    register = atexit.register
+    monkeypatch.setattr(atexit, "register",
+        lambda func, *args, **kwargs: func if func is media.exiftool_close else register(func, *args, **kwargs))
+    files = [tmp_path / f"clip{i}.dat" for i in range(8)]
+    for file in files:
+        file.write_bytes(b"data")
+
+    assert get_create_timestamps(files, jobs=2) == [(datetime(2019, 8, 7, 6, 5, 4), None)] * 8
+    # Each pool worker started its own exiftool, and stopped it before exiting
+    time.sleep(0.2)
+    assert list(pid_dir.iterdir()) == []
+
+
+def test_cache_hits_by_device_and_inode(tmp_path):
+    photo = tmp_path / "photo.jpg"
+    photo.write_bytes(b"photo")
+    cache = MediaTimestampCache(tmp_path / "cache.json")
+    cache.put(photo, datetime(2020, 1, 2))
+    stat = photo.stat()
+    assert list(cache.entries) == [f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"]
+
+    cache.save()
+    os.link(photo, tmp_path / "link.jpg")
+    assert MediaTimestampCache(tmp_path / "cache.json").get(tmp_path / "link.jpg") == datetime(2020, 1, 2)
+
+def test_cache_drops_miss_hashes_at_save(tmp_path):
+    photo = tmp_path / "photo.jpg"
+    photo.write_bytes(b"photo")
+    cache = MediaTimestampCache(tmp_path / "cache.json", use_hash=True)
+    assert cache.get(photo) is None
+    assert len(cache.miss_hashes) == 1
+    cache.save()
+    assert cache.miss_hashes == {}
+
+def test_cache_evicts_least_recently_used_probing_only_the_oldest(tmp_path, monkeypatch):
+    cache = MediaTimestampCache(tmp_path / "cache.json", max_entries=18)
+    for i in range(20):
+        photo = tmp_path / f"{i}.jpg"
+        photo.write_bytes(b"photo" * (i + 1))
+        cache.put(photo, datetime(2020, 1, 2))
+        cache.entries[next(reversed(cache.entries))]["used"] = i
+    (tmp_path / "5.jpg").unlink()
+    (tmp_path / "19.jpg").unlink()
+
+    probed = []
+    real_stat = os.stat
+    def stat(path, *args, **kwargs):
+        if str(path).endswith(".jpg"):
+            probed.append(path)
+        return real_stat(path, *args, **kwargs)
+    monkeypatch.setattr(os, "stat", stat)
+    cache.save()
+
+    # 2 entries to evict: only the 8 oldest are probed, so the deleted 5.jpg
+    # goes first, then the oldest, while the recently used 19.jpg stays
+    assert len(probed) == 2 * MediaTimestampCache.EVICT_PROBE_FACTOR
+    assert sorted(int(Path(entry["path"]).stem) for entry in cache.entries.values()) == [
+        i for i in range(1, 20) if i != 5]
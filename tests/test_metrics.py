@@ -0,0 +1,72 @@
+import os
+import time
+
+import pytest
+
+from cloud_services_backup_cli.lib.metrics import metrics_file
+from cloud_services_backup_cli.lib.timing import report_count, span, timed_run
+
+
+@pytest.fixture
+def metrics(tmp_path, monkeypatch):
+    monkeypatch.setenv("CLOUD_BACKUP_DATAD", str(tmp_path))
+    monkeypatch.setenv("CLOUD_BACKUP_METRICS_DIR", str(tmp_path / "textfiles"))
+    # Each write is checked to replace the .prom file with a complete tmp file
+    replaced = []
+    replace = os.replace
+    def checked_replace(src, dst):
+        if str(dst).endswith(".prom"):
+            assert str(src) == f"{dst}.tmp"
+            replaced.append(open(src).read())
+        replace(src, dst)
+    monkeypatch.setattr(os, "replace", checked_replace)
+    return replaced
+
+def samples(prom_file) -> dict[str, str]:
+    # Metric name (without prefix or labels) → value
+    lines = [line for line in prom_file.read_text().splitlines() if not line.startswith("#")]
+    return { line.split("{")[0].removeprefix("cloud_backup_"): line.rsplit(" ", 1)[1] for line in lines }
+
+def run(monkeypatch, now: float, fail: bool = False, **counters: int) -> None:
+    monkeypatch.setattr(time, "time", lambda: now)
+    with timed_run("test-service", "Me@Example.com", "copy"):
+        with span("backup"):
+            for name, value in counters.items():
+                report_count(name, value)
+            if fail:
+                raise RuntimeError("backup failed")
+
+
+def test_writes_metrics_for_success_then_failure(metrics, monkeypatch):
+    prom_file = metrics_file("test-service", "Me@Example.com")
+    run(monkeypatch, 1000.0, files_added=3, files_deleted=0)
+    first = samples(prom_file)
+    assert first["last_success_timestamp_seconds"] == "1000.000"
+    assert first["last_run_timestamp_seconds"] == "1000.000"
+    assert first["last_run_success"] == "1"
+    assert (first["files_added"], first["files_deleted"]) == ("3", "0")
+    assert 'phase="backup"' in prom_file.read_text()
+    assert 'user="Me@Example.com"' in prom_file.read_text()
+
+    with pytest.raises(RuntimeError):
+        run(monkeypatch, 2000.0, fail=True, bytes_transferred=10)
+    second = samples(prom_file)
+    assert second["last_success_timestamp_seconds"] == "1000.000"
+    assert second["last_run_timestamp_seconds"] == "2000.000"
+    assert second["last_run_success"] == "0"
+    assert second["bytes_transferred"] == "10"
+    # Counters this run didn't report are left out, not carried over or zeroed
+    assert "files_added" not in second and "files_deleted" not in second
+
+    # Both runs replaced the file whole, leaving no tmp file behind
+    assert len(metrics) == 2
+    assert metrics[-1] == prom_file.read_text()
+    assert [p.name for p in prom_file.parent.iterdir()] == [prom_file.name]
+
+def test_failure_without_earlier_success_has_no_last_success(metrics, monkeypatch):
+    with pytest.raises(RuntimeError):
+        run(monkeypatch, 1000.0, fail=True)
+    text = metrics_file("test-service", "Me@Example.com").read_text()
+    assert "# TYPE cloud_backup_last_success_timestamp_seconds gauge" in text
+    assert "last_success_timestamp_seconds{" not in text
+    assert "last_run_success" in samples(metrics_file("test-service", "Me@Example.com"))
@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+
+from cloud_services_backup_cli.tools import rclone
+from cloud_services_backup_cli.tools.rclone import RcloneStats, rclone_transfer
+
+
+def stats_line(**stats) -> str:
+    return json.dumps({ "level": "notice", "msg": "\nTransferred: ...\n", "source": "accounting/stats.go:498",
+        "stats": stats, "time": "2025-06-01T00:00:05.000000+00:00" })
+
+# Captured from 'rclone sync --use-json-log --stats 5s --stats-log-level NOTICE',
+# with a plain line as printed by a failing docker run mixed in
+LOG_LINES = [
+    json.dumps({ "level": "info", "msg": "Copied (new)", "object": "Drive/a.txt", "objectType": "*drive.Object",
+        "source": "operations/copy.go:285", "time": "2025-06-01T00:00:01.000000+00:00" }),
+    "2025/06/01 00:00:02 NOTICE: plain log line",
+    stats_line(bytes=1048576, checks=2, deletes=0, elapsedTime=5.0, errors=0, eta=5, speed=209715.2,
+        totalBytes=2097152, totalChecks=4, totalTransfers=2, transfers=1),
+    json.dumps({ "level": "error", "msg": "Failed to copy: quota exceeded\n", "object": "Drive/b.txt",
+        "source": "operations/copy.go:301", "time": "2025-06-01T00:00:06.000000+00:00" }),
+    "{not json",
+    stats_line(bytes=2097152, checks=4, deletes=1, elapsedTime=10.5, errors=1, eta=None, speed=0,
+        totalBytes=2097152, totalChecks=4, totalTransfers=2, transfers=2, fatalError=False),
+]
+
+
+@pytest.fixture
+def fake_rclone(tmp_path, monkeypatch):
+    # rclone that writes the lines in $RCLONE_LOG to stderr, then
+    # exits with $RCLONE_EXIT
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "rclone"
+    script.write_text(f"#!{sys.executable}\n" + "\n".join([
+        "import os, sys",
+        "sys.stderr.write(open(os.environ['RCLONE_LOG']).read())",
+        "sys.exit(int(os.environ.get('RCLONE_EXIT', '0')))",
+    ]))
+    script.chmod(0o755)
+    log_file = tmp_path / "rclone.log"
+    log_file.write_text("\n".join(LOG_LINES) + "\n")
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("RCLONE_LOG", str(log_file))
+    monkeypatch.setattr(rclone, "RCLONE_RCD", False)
+    return log_file
+
+
+def test_stats_from_json():
+    stats = RcloneStats.from_json(json.loads(LOG_LINES[2])["stats"])
+    assert stats == RcloneStats(bytes=1048576, total_bytes=2097152, transfers=1, total_transfers=2,
+        checks=2, total_checks=4, deletes=0, errors=0, speed=209715.2, eta=5, elapsed_seconds=5.0)
+    assert stats.progress() == "1.0 / 2.0 MB, 0.2 MB/s, ETA 0:00:05, 1/2 transferred, 2/4 checked (0/s), 0 error(s)"
+
+def test_stats_from_json_with_missing_and_null_fields():
+    stats = RcloneStats.from_json({ "bytes": 10, "speed": None, "eta": None, "elapsedTime": None })
+    assert stats == RcloneStats(bytes=10)
+    assert stats.checks_per_second() == 0.0
+    assert "ETA -" in stats.progress()
+
+@pytest.mark.parametrize("line, entry", [
+    ('{"level": "info", "msg": "hi"}\n', { "level": "info", "msg": "hi" }),
+    ("2025/06/01 00:00:02 NOTICE: plain\n", None),
+    ("{not json\n", None),
+    ('{"level": "info"\n', None),
+    ("[1, 2]\n", None),
+])
+def test_parses_json_log_lines(line, entry):
+    assert getattr(rclone, "__parse_log_line")(line) == entry
+
+def test_transfer_reports_stats_and_passes_log_through(fake_rclone, capsys, caplog):
+    updates = []
+    with caplog.at_level(logging.DEBUG):
+        stats = rclone_transfer("sync", "remote:/", "/backup/", progress=updates.append)
+
+    assert [(s.bytes, s.transfers) for s in updates] == [(1048576, 1), (2097152, 2)]
+    assert stats == updates[-1]
+    assert (stats.deletes, stats.errors, stats.eta, stats.elapsed_seconds) == (1, 1, None, 10.5)
+    out = capsys.readouterr().out.splitlines()
+    assert out == [
+        "2025/06/01 00:00:02 NOTICE: plain log line",
+        "{not json",
+        "rclone sync finished: 2 file(s) transferred (2.0 MB), 4 checked, 1 deleted, 1 error(s) in 10.5s",
+    ]
+    assert [(r.levelno, r.getMessage()) for r in caplog.records if "Drive/" in r.getMessage()] == [
+        (logging.INFO, "Drive/a.txt: Copied (new)"),
+        (logging.ERROR, "Drive/b.txt: Failed to copy: quota exceeded"),
+    ]
+
+def test_transfer_raises_after_reporting_when_rclone_fails(fake_rclone, monkeypatch, capsys):
+    monkeypatch.setenv("RCLONE_EXIT", "3")
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        rclone_transfer("copy", "remote:/", "/backup/", progress=lambda stats: None)
+    assert e.value.returncode == 3
+    assert "rclone copy finished: 2 file(s) transferred" in capsys.readouterr().out
@@ -0,0 +1,116 @@
+from pathlib import Path
+import sys
+import time
+
+import pytest
+
+from cloud_services_backup_cli.lib import runner, service
+from cloud_services_backup_cli.lib.runner import Job, read_jobs, run_jobs
+from cloud_services_backup_cli.lib.service import Service
+
+
+class StubService(Service):
+    # copy <events file> <seconds> [<exit code>] records when it ran, so
+    # tests can tell which jobs overlapped
+    def info(self) -> None:
+        print(f"Stub for {self.username}")
+
+    def setup(self, *args: str) -> None:
+        pass
+
+    def setup_required(self) -> bool:
+        return False
+
+    def copy(self, events_file: str, seconds: str, exit_code: str = "0") -> None:
+        started = time.time()
+        time.sleep(float(seconds))
+        with open(events_file, "a") as f:
+            f.write(f"{self.resource_class} {self.username} {started} {time.time()}\n")
+        sys.exit(int(exit_code))
+
+    def _backup(self, subcommand: str, *args: str) -> None:
+        pass
+
+class StubDiskService(StubService):
+    resource_class = "disk"
+
+
+@pytest.fixture
+def stubs(monkeypatch, tmp_path):
+    monkeypatch.setenv("CLOUD_BACKUP_DATAD", str(tmp_path))
+    monkeypatch.setitem(service.REGISTRY, "stub-network", StubService)
+    monkeypatch.setitem(service.REGISTRY, "stub-disk", StubDiskService)
+    return tmp_path / "events.txt"
+
+def write_jobs(tmp_path, text: str) -> Path:
+    jobs_file = tmp_path / "jobs.txt"
+    jobs_file.write_text(text)
+    return jobs_file
+
+def max_overlap(events_file: Path, resource_class: str, username: str | None = None) -> int:
+    intervals = []
+    for line in events_file.read_text().splitlines():
+        (job_class, job_user, started, finished) = line.split()
+        if job_class == resource_class and username in (None, job_user):
+            intervals.append((float(started), float(finished)))
+    return max(sum(1 for s, f in intervals if s <= start < f) for start, _ in intervals)
+
+
+def test_reads_jobs(stubs, tmp_path):
+    jobs_file = write_jobs(tmp_path, """
+        # Nightly backups
+        stub-network copy alice
+
+        stub-disk sync bob "My Album" --flag  # trailing comment
+    """)
+    assert read_jobs(jobs_file) == [
+        Job("stub-network", "copy", "alice", [], "network", 3),
+        Job("stub-disk", "sync", "bob", ["My Album", "--flag"], "disk", 5),
+    ]
+    assert read_jobs(jobs_file)[1].name() == "stub-disk sync bob 'My Album' --flag"
+
+@pytest.mark.parametrize("text, message", [
+    ("stub-network copy", "jobs.txt:1: expected '<service> <subcommand> <username> [<args>...]'"),
+    ("\nmissing copy alice", "jobs.txt:2: invalid service 'missing'"),
+    ("stub-network backup alice", "jobs.txt:1: invalid subcommand 'backup', expected one of copy, sync"),
+    ("stub-network copy alice 'unclosed", "jobs.txt:1: No closing quotation"),
+])
+def test_rejects_invalid_jobs(stubs, tmp_path, capsys, text, message):
+    with pytest.raises(SystemExit):
+        read_jobs(write_jobs(tmp_path, text))
+    assert message in capsys.readouterr().err
+
+def test_rejects_missing_jobs_file(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        read_jobs(tmp_path / "jobs.txt")
+    assert "Jobs file not found" in capsys.readouterr().err
+
+def test_runs_jobs_within_class_limits(stubs, monkeypatch, capsys):
+    monkeypatch.setattr(runner, "RUN_JOBS", 4)
+    monkeypatch.setitem(runner.RUN_CLASS_JOBS, "network", 2)
+    monkeypatch.setitem(runner.RUN_CLASS_JOBS, "disk", 2)
+    jobs = [Job("stub-network", "copy", f"user{i}", [str(stubs), "0.5"], "network", i) for i in range(1, 4)]
+    jobs += [
+        Job("stub-disk", "copy", "alice", [str(stubs), "0.5"], "disk", 4),
+        Job("stub-disk", "copy", "alice", [str(stubs), "0.5"], "disk", 5),
+        Job("stub-disk", "copy", "bob", [str(stubs), "0.5"], "disk", 6),
+    ]
+    results = run_jobs(jobs)
+
+    assert [(r.job.line, r.status()) for r in results] == [(i, "ok") for i in range(1, 7)]
+    assert max_overlap(stubs, "network") == 2
+    # Disk jobs of different users overlap, but not those of the same user
+    assert max_overlap(stubs, "disk") == 2
+    assert max_overlap(stubs, "disk", "alice") == 1
+    out = capsys.readouterr().out
+    assert out.count("Starting '") == 6
+    assert "Finished 'stub-disk copy bob" in out
+
+def test_failed_job_doesnt_stop_others(stubs, capsys):
+    results = run_jobs([
+        Job("stub-network", "copy", "alice", [str(stubs), "0", "3"], "network", 1),
+        Job("stub-network", "copy", "bob", [str(stubs), "0"], "network", 2),
+    ])
+    assert [r.status() for r in results] == ["failed (3)", "ok"]
+    assert "Finished 'stub-network copy alice" in capsys.readouterr().out
+    assert len(stubs.read_text().splitlines()) == 2
@@ -0,0 +1,128 @@
+import errno
+import os
+
+import pytest
+
+from cloud_services_backup_cli.tools.sync import sync_files, sync_tree
+
+
+def write(path, data="x", mtime=1_600_000_000):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(data)
+    os.utime(path, (mtime, mtime))
+    return path
+
+def tree(root):
+    return sorted(
+        str(path.relative_to(root)) + ("/" if path.is_dir() else "")
+        for path in root.rglob("*"))
+
+
+def test_copies_new_tree(tmp_path):
+    write(tmp_path / "src/a.txt", "a")
+    write(tmp_path / "src/sub/b.txt", "bb")
+    result = sync_tree(tmp_path / "src", tmp_path / "dest")
+    assert tree(tmp_path / "dest") == ["a.txt", "sub/", "sub/b.txt"]
+    assert (tmp_path / "dest/sub/b.txt").read_text() == "bb"
+    assert os.stat(tmp_path / "dest/a.txt").st_mtime == 1_600_000_000
+    assert (tmp_path / "dest/a.txt").stat().st_ino != (tmp_path / "src/a.txt").stat().st_ino
+    assert (result.count("created"), result.count("updated"), result.unchanged) == (3, 0, 0)
+    assert result.transferred_bytes() == 3
+
+def test_updates_changed_files(tmp_path):
+    write(tmp_path / "src/same.txt", "same")
+    write(tmp_path / "src/mtime.txt", "new", mtime=1_600_000_100)
+    write(tmp_path / "src/size.txt", "longer")
+    write(tmp_path / "dest/same.txt", "same")
+    write(tmp_path / "dest/mtime.txt", "old")
+    write(tmp_path / "dest/size.txt", "short")
+    result = sync_tree(tmp_path / "src", tmp_path / "dest")
+    assert (tmp_path / "dest/mtime.txt").read_text() == "new"
+    assert (tmp_path / "dest/size.txt").read_text() == "longer"
+    assert sorted(c.path for c in result.changes if c.action == "updated") == ["mtime.txt", "size.txt"]
+    assert result.unchanged == 1
+
+def test_update_skips_files_newer_in_dest(tmp_path):
+    write(tmp_path / "src/a.txt", "source", mtime=1_600_000_000)
+    write(tmp_path / "dest/a.txt", "dest", mtime=1_600_000_100)
+    assert sync_tree(tmp_path / "src", tmp_path / "dest", update=True).unchanged == 1
+    assert (tmp_path / "dest/a.txt").read_text() == "dest"
+
+    sync_tree(tmp_path / "src", tmp_path / "dest")
+    assert (tmp_path / "dest/a.txt").read_text() == "source"
+
+def test_ignore_existing_skips_changed_files(tmp_path):
+    write(tmp_path / "src/a.txt", "changed", mtime=1_600_000_100)
+    write(tmp_path / "src/b.txt", "new")
+    write(tmp_path / "dest/a.txt", "original")
+    result = sync_tree(tmp_path / "src", tmp_path / "dest", ignore_existing=True)
+    assert (tmp_path / "dest/a.txt").read_text() == "original"
+    assert (tmp_path / "dest/b.txt").read_text() == "new"
+    assert ([c.path for c in result.changes], result.unchanged) == (["b.txt"], 1)
+
+def test_delete_removes_extraneous_files_and_dirs(tmp_path):
+    write(tmp_path / "src/keep.txt")
+    write(tmp_path / "dest/keep.txt")
+    write(tmp_path / "dest/extra.txt", "extra")
+    write(tmp_path / "dest/old/nested.txt")
+    result = sync_tree(tmp_path / "src", tmp_path / "dest", delete=True)
+    assert tree(tmp_path / "dest") == ["keep.txt"]
+    assert sorted(c.path for c in result.changes if c.action == "deleted") == ["extra.txt", "old"]
+    assert result.transferred_bytes() == 0
+
+def test_keeps_extraneous_files_without_delete(tmp_path):
+    write(tmp_path / "src/keep.txt")
+    write(tmp_path / "dest/extra.txt")
+    sync_tree(tmp_path / "src", tmp_path / "dest")
+    assert tree(tmp_path / "dest") == ["extra.txt", "keep.txt"]
+
+def test_replaces_file_with_dir(tmp_path):
+    write(tmp_path / "src/thing/a.txt")
+    write(tmp_path / "dest/thing")
+    result = sync_tree(tmp_path / "src", tmp_path / "dest")
+    assert tree(tmp_path / "dest") == ["thing/", "thing/a.txt"]
+    assert [c.action for c in result.changes] == ["deleted", "created", "created"]
+
+def test_include_filters_both_sides(tmp_path):
+    write(tmp_path / "src/a.jpg")
+    write(tmp_path / "src/a.json")
+    write(tmp_path / "src/sub/b.jpg")
+    write(tmp_path / "dest/stale.jpg")
+    write(tmp_path / "dest/notes.txt")
+    result = sync_tree(tmp_path / "src", tmp_path / "dest", delete=True,
+        include=lambda name: name.endswith(".jpg"))
+    assert tree(tmp_path / "dest") == ["a.jpg", "notes.txt", "sub/", "sub/b.jpg"]
+    assert [c.path for c in result.changes if c.action == "deleted"] == ["stale.jpg"]
+
+def test_link_hard_links_files(tmp_path):
+    source = write(tmp_path / "src/a.txt")
+    sync_tree(tmp_path / "src", tmp_path / "dest", link=True)
+    assert (tmp_path / "dest/a.txt").stat().st_ino == source.stat().st_ino
+    assert source.stat().st_nlink == 2
+
+def test_link_falls_back_to_copy(tmp_path, monkeypatch):
+    def link(*args, **kwargs):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+    monkeypatch.setattr(os, "link", link)
+    source = write(tmp_path / "src/a.txt", "data")
+    result = sync_tree(tmp_path / "src", tmp_path / "dest", link=True)
+    assert (tmp_path / "dest/a.txt").read_text() == "data"
+    assert (tmp_path / "dest/a.txt").stat().st_ino != source.stat().st_ino
+    assert result.count("created") == 1
+
+def test_link_raises_other_errors(tmp_path, monkeypatch):
+    def link(*args, **kwargs):
+        raise OSError(errno.EIO, "I/O error")
+    monkeypatch.setattr(os, "link", link)
+    write(tmp_path / "src/a.txt")
+    with pytest.raises(OSError):
+        sync_tree(tmp_path / "src", tmp_path / "dest", link=True)
+    assert tree(tmp_path / "dest") == []
+
+def test_sync_files_renames_into_dest(tmp_path):
+    source = write(tmp_path / "src/IMG_1.jpg", "photo")
+    write(tmp_path / "dest/other.jpg")
+    result = sync_files({ "2020-01 IMG_1.jpg": source }, tmp_path / "dest", delete=True)
+    assert tree(tmp_path / "dest") == ["2020-01 IMG_1.jpg"]
+    assert (result.count("created"), result.count("deleted")) == (1, 1)
+    assert result.summary() == "1 created, 0 updated, 1 deleted, 0 unchanged"